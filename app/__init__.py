@@ -1,16 +1,30 @@
 # __init__.py
+import os
+import time
+import logging
+
+_import_started = time.perf_counter()
+
 from flask import Flask, session
 from config import Config
 from flask_login import LoginManager
 from .models import User
-from .services import get_supabase
+from .dropbox_pool import init_request_stats
+
+# Time spent importing Flask, its extensions and the Dropbox SDK; the services
+# are imported with the routes, so they count towards create_app
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+logger = logging.getLogger(__name__)
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(Config)
 
     login_manager = LoginManager()
     login_manager.init_app(app)
+    init_request_stats(app)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -24,6 +38,8 @@ def create_app():
     from .routes import init_routes
     init_routes(app)
 
+    logger.info(
+        f"App imports took {IMPORT_SECONDS:.2f}s, create_app took "
+        f"{time.perf_counter() - started:.2f}s (pid {os.getpid()})"
+    )
     return app
-
-
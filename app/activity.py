@@ -0,0 +1,184 @@
+# activity.py
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _PendingRow:
+    def __init__(self, client, row, wait):
+        self.client = client
+        self.row = row
+        self.written = threading.Event() if wait else None
+        self.ok = False
+
+    def done(self, ok):
+        self.ok = ok
+        if self.written is not None:
+            self.written.set()
+
+
+class ActivityRecorder:
+    """Write-behind buffer for activity log rows.
+
+    record() queues a row and returns at once. A background thread collects
+    queued rows for up to flush_interval seconds, or until it has batch_size of
+    them, and writes them with one multi-row insert, retrying failed batches with
+    backoff. Whatever is still queued when the worker exits is written by an
+    atexit hook. When the queue is full, rows are written synchronously instead of
+    being dropped. If on_written is given, it is called with the stored rows of
+    each batch, ids included.
+    """
+
+    def __init__(
+        self,
+        table,
+        max_queue=10000,
+        batch_size=100,
+        flush_interval=1,
+        max_retries=5,
+        retry_delay=1,
+        on_written=None,
+    ):
+        self.table = table
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "retries": 0, "dropped": 0}
+
+    def record(self, client, row, wait=False, timeout=30):
+        """Queues row for insertion with client.
+
+        With wait, blocks until the row is written (or timeout passes) and returns
+        whether it was; otherwise returns None straight away.
+        """
+        self._ensure_flusher()
+        pending = _PendingRow(client, row, wait)
+        try:
+            self._queue.put_nowait(pending)
+            self._count(queued=1)
+        except queue.Full:
+            logger.warning("Activity queue is full, writing row synchronously")
+            self._write([pending])
+        if wait:
+            pending.written.wait(timeout)
+            return pending.ok
+        return None
+
+    def close(self, timeout=10):
+        """Stops the flusher after it has written everything already queued."""
+        flusher = self._flusher
+        if flusher is None or self._flusher_pid != os.getpid() or not flusher.is_alive():
+            return
+        self._queue.put(_STOP)
+        flusher.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        return {**stats, "pending": self._queue.qsize()}
+
+    def _count(self, **increments):
+        # Request threads and the flusher both count, and += is not atomic
+        with self._lock:
+            for name, increment in increments.items():
+                self._stats[name] += increment
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so each worker starts its own flusher
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            self._flusher = threading.Thread(
+                target=self._run, name="activity-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            batch = []
+            stopping = False
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if stopping:
+                # Drain what arrived before the stop marker
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        # Rows are grouped by client, which in practice is the worker's shared one
+        by_client = {}
+        for pending in batch:
+            by_client.setdefault(id(pending.client), []).append(pending)
+
+        for group in by_client.values():
+            for start in range(0, len(group), self.batch_size):
+                self._insert(group[start : start + self.batch_size])
+
+    def _insert(self, group):
+        rows = [pending.row for pending in group]
+        delay = self.retry_delay
+        for attempt in range(self.max_retries):
+            try:
+                # Rows only need to come back when someone is told about them
+                returning = "representation" if self.on_written else "minimal"
+                client = group[0].client
+                response = client.table(self.table).insert(rows, returning=returning).execute()
+                self._count(written=len(rows), batches=1)
+                for pending in group:
+                    pending.done(True)
+                if self.on_written is not None:
+                    try:
+                        self.on_written(response.data)
+                    except Exception as e:
+                        logger.error(f"Activity write callback failed: {e}")
+                return
+            except Exception as e:
+                logger.error(f"Attempt {attempt + 1} to write {len(rows)} activity rows failed: {e}")
+                if attempt < self.max_retries - 1:
+                    self._count(retries=1)
+                    time.sleep(delay)
+                    delay *= 2  # Exponential backoff
+        self._count(dropped=len(rows))
+        logger.error(f"Dropped activity rows after {self.max_retries} attempts: {rows}")
+        for pending in group:
+            pending.done(False)
@@ -0,0 +1,366 @@
+# async_services.py
+import os
+import asyncio
+import logging
+import threading
+
+import httpx
+from flask import flash, url_for
+
+from .dropbox_pool import get_dropbox_client
+from .pagination import keyset_params, next_page
+from .services import (
+    ACTIVITY_COLUMNS,
+    ASSIGNMENT_COLUMNS,
+    comment_cache,
+    folder_cache,
+    get_folder_validator as _get_folder_validator,
+    temporary_link_cache,
+    thumbnail_store,
+    version_index,
+)
+
+logger = logging.getLogger(__name__)
+
+DROPBOX_API_URL = "https://api.dropboxapi.com/2"
+
+_io = {"pid": None, "loop": None, "dropbox": None, "supabase": None}
+_io_lock = threading.Lock()
+
+
+class DropboxAPIError(Exception):
+    def __init__(self, endpoint, status_code, summary):
+        super().__init__(f"{endpoint} failed with {status_code}: {summary}")
+        self.status_code = status_code
+        self.summary = summary
+
+
+def _io_loop():
+    # Threads do not survive a fork, so each worker starts its own loop
+    if _io["pid"] != os.getpid():
+        with _io_lock:
+            if _io["pid"] != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="async-io-loop", daemon=True
+                ).start()
+                _io.update(pid=os.getpid(), loop=loop, dropbox=None, supabase=None)
+    return _io["loop"]
+
+
+def _limits(config):
+    max_connections = config.get("ASYNC_MAX_CONNECTIONS", 32)
+    return httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+
+
+def _http_client(config):
+    """Returns the shared AsyncClient for the Dropbox API; only called on the I/O loop."""
+    if _io["dropbox"] is None:
+        _io["dropbox"] = httpx.AsyncClient(base_url=DROPBOX_API_URL, limits=_limits(config))
+    return _io["dropbox"]
+
+
+def _supabase_client(config):
+    """Returns the shared AsyncClient for Supabase's PostgREST API; only called on the I/O loop."""
+    if _io["supabase"] is None:
+        _io["supabase"] = httpx.AsyncClient(
+            base_url=f"{config['SUPABASE_URL']}/rest/v1",
+            headers={
+                "apikey": config["SUPABASE_KEY"],
+                "Authorization": f"Bearer {config['SUPABASE_KEY']}",
+            },
+            limits=_limits(config),
+        )
+    return _io["supabase"]
+
+
+async def run(coro, timeout=None, config=None):
+    """Runs coro on the worker's I/O loop, where the shared connection pools live.
+
+    Awaitable from any event loop, including the one Flask starts for an async
+    view. The call is cancelled once timeout seconds have passed.
+    """
+    if timeout is None and config is not None:
+        timeout = config.get("ASYNC_CALL_TIMEOUT", 10)
+    future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(coro, timeout), _io_loop())
+    return await asyncio.wrap_future(future)
+
+
+async def gather(*calls, return_exceptions=False):
+    """Awaits independent calls at the same time, returning their results in order."""
+    return await asyncio.gather(*calls, return_exceptions=return_exceptions)
+
+
+async def resolved(value):
+    """An already finished call, for optional slots in gather()."""
+    return value
+
+
+async def _dropbox_rpc(config, endpoint, payload):
+    dbx = get_dropbox_client(config)
+    # Usually cached; a refresh is a blocking call, so keep it off the loop
+    token = await asyncio.to_thread(dbx.access_token)
+    response = await _http_client(config).post(
+        endpoint, json=payload, headers={"Authorization": f"Bearer {token}"}
+    )
+    if response.status_code != 200:
+        try:
+            summary = response.json().get("error_summary", response.text)
+        except ValueError:
+            summary = response.text
+        raise DropboxAPIError(endpoint, response.status_code, summary)
+    return response.json()
+
+
+async def _list_entries(config, path):
+    # The folder cache keeps listings current from their cursors; a stale one
+    # is a blocking SDK call, so keep it off the loop
+    return await asyncio.to_thread(folder_cache.list, get_dropbox_client(config), path)
+
+
+async def list_folders(config, path="", timeout=None):
+    """Async list_folders: names of the folders directly inside path."""
+    try:
+        entries = await run(_list_entries(config, path), timeout, config)
+        return [entry["name"] for entry in entries if entry["type"] == "folder"]
+    except Exception as e:
+        logger.error(f"Failed to list folders: {e}")
+        return []
+
+
+async def get_folder_validator(config, path):
+    """Async get_folder_validator, from the folder cache off the loop."""
+    return await asyncio.to_thread(_get_folder_validator, get_dropbox_client(config), path)
+
+
+async def _temporary_link(config, full_path):
+    cached_link = temporary_link_cache.get(full_path.lower())
+    if cached_link:
+        return cached_link
+    result = await _dropbox_rpc(config, "/files/get_temporary_link", {"path": full_path})
+    temporary_link_cache.set(full_path.lower(), result["link"])
+    return result["link"]
+
+
+async def get_image_url(config, file_path, timeout=None):
+    """Async get_image_url: a temporary link for file_path, or None."""
+    full_path = f"/{file_path.lstrip('/')}"
+    try:
+        return await run(
+            _temporary_link(config, full_path),
+            timeout or config["THUMBNAIL_LINK_TIMEOUT"],
+        )
+    except Exception as e:
+        logger.error(f"Failed to get temporary link for {full_path}: {e}")
+        return None
+
+
+async def get_image_urls(config, file_paths):
+    """Async get_image_urls, resolving at most THUMBNAIL_LINK_WORKERS links at a time.
+
+    Links that fail or time out map to None.
+    """
+    slots = asyncio.Semaphore(config["THUMBNAIL_LINK_WORKERS"])
+
+    async def limited(file_path):
+        async with slots:
+            return await get_image_url(config, file_path)
+
+    links = await gather(*(limited(file_path) for file_path in file_paths))
+    return dict(zip(file_paths, links))
+
+
+async def get_versions_info(config, path, game, asset, offset=0, limit=None):
+    """Async get_versions_info: one page of an asset's versions with thumbnails.
+
+    Returns (versions newest first, whether older versions follow).
+    """
+    try:
+        # The index is in memory; only a stale folder touches Dropbox, and that
+        # goes through the blocking SDK, so keep it off the loop
+        versions, has_more = await asyncio.to_thread(
+            version_index.history,
+            get_dropbox_client(config),
+            f"{path}/{game}/{asset}",
+            offset,
+            limit or config["VERSION_PAGE_SIZE"],
+        )
+    except Exception as e:
+        logger.error(f"Failed to list versions of {game}/{asset}: {e}")
+        return [], False
+    files = {
+        f"/{game}/{asset}/{version['filename']}": version["content_hash"] for version in versions
+    }
+    # Cached thumbnails are a stat each; missing ones are one batch call per 25
+    available = await asyncio.to_thread(thumbnail_store.fetch, get_dropbox_client(config), files)
+    thumbnail_urls = {
+        path: url_for("thumbnail", path=path, v=content_hash)
+        for path, content_hash in available.items()
+    }
+    # Files Dropbox cannot render fall back to links to the originals
+    thumbnail_urls.update(
+        await get_image_urls(config, [path for path in files if path not in thumbnail_urls])
+    )
+    versions_info = [
+        {**version, "thumbnail_url": thumbnail_urls.get(f"/{game}/{asset}/{version['filename']}")}
+        for version in versions
+    ]
+    return versions_info, has_more
+
+
+
+async def _select(config, table, columns, params=(), count=False):
+    """GETs rows from a Supabase table; params are PostgREST query parameters.
+
+    With count, returns (rows, total rows matching) rather than the rows.
+    """
+    response = await _supabase_client(config).get(
+        f"/{table}",
+        params=[("select", columns), *params],
+        headers={"Prefer": "count=exact"} if count else None,
+    )
+    response.raise_for_status()
+    if not count:
+        return response.json()
+    # Content-Range reads "0-0/total", or "*/0" when nothing matches
+    total = response.headers.get("content-range", "").rpartition("/")[2]
+    return response.json(), int(total) if total.isdigit() else None
+
+
+async def get_activity_page(config, status, cursor=None, limit=None, timeout=None):
+    """Async get_activity_page: one page of activity with a status, newest first.
+
+    Returns (entries, cursor for the next page or None).
+    """
+    limit = limit or config["DASHBOARD_PAGE_SIZE"]
+    params = [("status", f"eq.{status}"), *keyset_params("created_at", cursor, limit)]
+    try:
+        rows = await run(_select(config, "activity_log", ACTIVITY_COLUMNS, params), timeout, config)
+    except Exception as e:
+        flash(f"Error fetching activity log: {e}")
+        return [], None
+    return next_page(rows, "created_at", limit)
+
+
+async def _count_activity(config, status, timeout):
+    try:
+        params = [("status", f"eq.{status}"), ("limit", "1")]
+        _, total = await run(
+            _select(config, "activity_log", "id", params, count=True), timeout, config
+        )
+        return total
+    except Exception as e:
+        logger.error(f"Error counting {status} activity: {e}")
+        return None
+
+
+async def get_activity_counts(config, statuses, timeout=None):
+    """Async get_activity_counts, counting every status at the same time."""
+    totals = await gather(*(_count_activity(config, status, timeout) for status in statuses))
+    return dict(zip(statuses, totals))
+
+
+async def get_newest_activity_id(config, timeout=None):
+    """Async get_newest_activity_id: None if it cannot be read."""
+    params = [("order", "id.desc"), ("limit", "1")]
+    try:
+        rows = await run(_select(config, "activity_log", "id", params), timeout, config)
+    except Exception as e:
+        logger.error(f"Error reading the newest activity: {e}")
+        return None
+    return rows[0]["id"] if rows else 0
+
+
+async def get_comments_by_activity_id(config, activity_id, timeout=None):
+    """Async get_comments_by_activity_id, newest first; None on failure."""
+    comments = await get_comments_for_activities(config, [activity_id], timeout)
+    return comments.get(str(activity_id)) if comments is not None else None
+
+
+async def get_comments_for_activities(config, activity_ids, timeout=None):
+    """Async get_comments_for_activities: comments grouped by activity id, newest first."""
+    grouped = {}
+    missing = []
+    for activity_id in dict.fromkeys(str(a) for a in activity_ids):
+        comments = comment_cache.get(activity_id)
+        if comments is None:
+            missing.append(activity_id)
+        else:
+            grouped[activity_id] = comments
+    if not missing:
+        return grouped
+
+    ids = ",".join(f'"{activity_id}"' for activity_id in missing)
+    params = [("activity_log_id", f"in.({ids})"), ("order", "created_at.desc")]
+    try:
+        rows = await run(_select(config, "comments", "*", params), timeout, config)
+    except Exception as e:
+        flash(f"Error fetching comments: {e}")
+        return None
+
+    fetched = {activity_id: [] for activity_id in missing}
+    for comment in rows:
+        fetched[str(comment["activity_log_id"])].append(comment)
+    for activity_id, comments in fetched.items():
+        comment_cache.set(activity_id, comments)
+    grouped.update(fetched)
+    return grouped
+
+
+def _assignment_params(filters, user_email):
+    params = []
+    if filters["mine"]:
+        params.append(("assigned_to", f"eq.{user_email}"))
+    if filters["due_from"]:
+        params.append(("to_be_completed_by", f"gte.{filters['due_from']}"))
+    if filters["due_to"]:
+        params.append(("to_be_completed_by", f"lte.{filters['due_to']}"))
+    return params
+
+
+async def get_assignments_page(config, filters, user_email, cursor=None, limit=None, timeout=None):
+    """Async get_assignments_page: one page of assignments matching filters, soonest due first.
+
+    Returns (assignments, cursor for the next page or None).
+    """
+    limit = limit or config["DASHBOARD_PAGE_SIZE"]
+    params = _assignment_params(filters, user_email)
+    if filters["status"] != "all":
+        params.append(("completed", f"eq.{str(filters['status'] == 'completed').lower()}"))
+    params += keyset_params("to_be_completed_by", cursor, limit, desc=False)
+    try:
+        rows = await run(
+            _select(config, "assignments", ASSIGNMENT_COLUMNS, params), timeout, config
+        )
+    except Exception as e:
+        flash(f"Error fetching assignments: {e}")
+        return [], None
+    return next_page(rows, "to_be_completed_by", limit)
+
+
+async def _assignments_state(config, filters, user_email, completed, timeout):
+    params = _assignment_params(filters, user_email) + [
+        ("completed", f"eq.{str(completed).lower()}"),
+        ("order", "id.desc"),
+        ("limit", "1"),
+    ]
+    rows, total = await run(
+        _select(config, "assignments", "id", params, count=True), timeout, config
+    )
+    return [total, rows[0]["id"] if rows else 0]
+
+
+async def get_assignments_validator(config, filters, user_email, timeout=None):
+    """Async get_assignments_validator, reading every completion state at the same time."""
+    states = [filters["status"] == "completed"] if filters["status"] != "all" else [False, True]
+    try:
+        counts = await gather(
+            *(
+                _assignments_state(config, filters, user_email, completed, timeout)
+                for completed in states
+            )
+        )
+    except Exception as e:
+        logger.error(f"Error reading assignment counts: {e}")
+        return None
+    return [user_email, filters, *counts]
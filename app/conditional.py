@@ -0,0 +1,75 @@
+# conditional.py
+import os
+import json
+import hashlib
+
+from flask import make_response, request, session
+
+from config import Config
+
+
+def _source_digest():
+    digest = hashlib.sha1()
+    root = os.path.dirname(__file__)
+    for directory, subdirectories, names in os.walk(root):
+        # temp holds runtime state, not code
+        subdirectories[:] = sorted(d for d in subdirectories if d not in ("temp", "__pycache__"))
+        for name in sorted(names):
+            if name.endswith((".py", ".html")):
+                path = os.path.join(directory, name)
+                digest.update(os.path.relpath(path, root).encode())
+                with open(path, "rb") as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Rendered pages change with the templates as well as the data, so their tags
+# also name the code that rendered them. It has to be the same in every worker,
+# however they were started, so it comes from the deployed code itself.
+CODE_VERSION = Config.APP_VERSION or _source_digest()
+
+
+def make_etag(validator):
+    return hashlib.sha1(json.dumps(validator, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def conditional(build, validator, page=False):
+    """Answers 304 Not Modified when the client's copy still matches validator.
+
+    validator is any JSON-serializable value that changes whenever the response
+    would, such as Dropbox revs or Supabase row ids and counts; None disables
+    the check. build() is only called for a full response, so an unchanged
+    resource costs neither a template render nor serialization. Responses carry
+    a weak ETag and have to be revalidated before each reuse.
+    """
+    etag = _etag(validator, page)
+    if etag is None:
+        return build()
+    if request.if_none_match.contains_weak(etag):
+        return _tagged(make_response("", 304), etag)
+    return _tagged(make_response(build()), etag)
+
+
+async def async_conditional(build, validator, page=False):
+    """conditional() for async views, where build is a coroutine function."""
+    etag = _etag(validator, page)
+    if etag is None:
+        return await build()
+    if request.if_none_match.contains_weak(etag):
+        return _tagged(make_response("", 304), etag)
+    return _tagged(make_response(await build()), etag)
+
+
+def _etag(validator, page):
+    # A pending flash message has to be rendered now, not on some later page
+    if validator is None or session.get("_flashes"):
+        return None
+    return make_etag([CODE_VERSION, validator] if page else validator)
+
+
+def _tagged(response, etag):
+    if response.status_code not in (200, 304):
+        return response
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
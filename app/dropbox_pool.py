@@ -0,0 +1,161 @@
+# dropbox_pool.py
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+
+import dropbox
+from flask import g, has_app_context
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+_totals = {"token_refreshes": 0, "new_connections": 0}
+_totals_lock = threading.Lock()
+
+
+def _record(counter):
+    """Counts an event for the process and, when inside a request, for that request."""
+    with _totals_lock:
+        _totals[counter] += 1
+    if has_app_context():
+        stats = g.setdefault("dropbox_stats", {"token_refreshes": 0, "new_connections": 0})
+        stats[counter] += 1
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _record("new_connections")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _record("new_connections")
+        return super()._new_conn()
+
+
+def _create_session(max_connections):
+    session = dropbox.create_session(max_connections=max_connections)
+    for adapter in session.adapters.values():
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+    return session
+
+
+class SharedTokenDropbox(dropbox.Dropbox):
+    """Dropbox client whose access token is shared and refreshed safely across threads."""
+
+    def __init__(self, *args, refresh_margin=600, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._refresh_lock = threading.Lock()
+        self._refresh_margin = refresh_margin
+        self._refresher = None
+
+    def _token_is_fresh(self):
+        expiration = self._oauth2_access_token_expiration
+        return bool(
+            self._oauth2_access_token
+            and expiration
+            and datetime.utcnow() + timedelta(seconds=dropbox.dropbox_client.TOKEN_EXPIRATION_BUFFER) < expiration
+        )
+
+    def check_and_refresh_access_token(self):
+        if self._token_is_fresh():
+            return
+        with self._refresh_lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self._token_is_fresh():
+                super().check_and_refresh_access_token()
+
+    def access_token(self):
+        """Returns a current access token for callers that talk to the HTTP API directly."""
+        self.check_and_refresh_access_token()
+        return self._oauth2_access_token
+
+    def refresh_access_token(self, *args, **kwargs):
+        super().refresh_access_token(*args, **kwargs)
+        _record("token_refreshes")
+
+    def start_background_refresh(self):
+        """Refreshes the access token shortly before it expires, off the request path."""
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="dropbox-token-refresh", daemon=True
+        )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            expiration = self._oauth2_access_token_expiration
+            if expiration is None:
+                delay = 0
+            else:
+                delay = (expiration - datetime.utcnow()).total_seconds() - self._refresh_margin
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                with self._refresh_lock:
+                    self.refresh_access_token(scope=self._scope)
+            except Exception as e:
+                logger.error(f"Background Dropbox token refresh failed: {e}")
+                time.sleep(30)
+
+
+def get_dropbox_client(config):
+    """Returns the worker's shared Dropbox client, creating it on first use."""
+    key = (
+        os.getpid(),
+        config["DROPBOX_OAUTH2_REFRESH_TOKEN"],
+        config["DROPBOX_APP_KEY"],
+    )
+    client = _registry.get(key)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        client = _registry.get(key)
+        if client is None:
+            client = SharedTokenDropbox(
+                oauth2_refresh_token=config["DROPBOX_OAUTH2_REFRESH_TOKEN"],
+                app_key=config["DROPBOX_APP_KEY"],
+                app_secret=config["DROPBOX_APP_SECRET"],
+                session=_create_session(config.get("DROPBOX_MAX_CONNECTIONS", 16)),
+                refresh_margin=config.get("DROPBOX_TOKEN_REFRESH_MARGIN", 600),
+            )
+            client.start_background_refresh()
+            _registry[key] = client
+    return client
+
+
+def get_http_session(config):
+    """Returns the keep-alive session behind the shared Dropbox client."""
+    return get_dropbox_client(config)._session
+
+
+def stats():
+    """Process-wide totals since the worker started."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def init_request_stats(app):
+    """Reports per-request token refreshes and new connections on every response."""
+
+    @app.after_request
+    def add_dropbox_stats(response):
+        request_stats = g.get("dropbox_stats")
+        if request_stats:
+            response.headers["X-Dropbox-Stats"] = (
+                f"token_refreshes={request_stats['token_refreshes']}; "
+                f"new_connections={request_stats['new_connections']}"
+            )
+            logger.info(f"Dropbox client stats for request: {request_stats}")
+        return response
@@ -0,0 +1,154 @@
+# events.py
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class _Subscription:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+
+
+class EventBroker:
+    """In-process pub/sub for dashboard events, delivered as Server-Sent Events.
+
+    publish() hands each event to every open stream of this worker. The last
+    history_size events are kept, so a stream reconnecting to the same worker
+    with Last-Event-ID gets what it missed; any other reconnect is told to
+    resync. Streams that fall max_queue events behind are closed the same way.
+    Other workers' changes only arrive through the optional Supabase realtime
+    feed, started by the first subscriber.
+    """
+
+    def __init__(self, max_subscribers=100, max_queue=100, history_size=200):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self._history = deque(maxlen=history_size)
+        self._subscriptions = set()
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._feed_pid = None
+
+    def publish(self, event_type, data):
+        with self._lock:
+            sequence = next(self._sequence)
+            message = (f"{os.getpid()}-{sequence}", event_type, data)
+            self._history.append((sequence, message))
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def stream(self, last_event_id=None, heartbeat_interval=15):
+        """Yields text/event-stream chunks until the client goes away.
+
+        Raises TooManySubscribers, before yielding anything, when the worker
+        already serves max_subscribers streams.
+        """
+        subscription = _Subscription(self.max_queue)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._subscriptions.add(subscription)
+            missed = self._missed_since(last_event_id)
+        return self._generate(subscription, missed, heartbeat_interval)
+
+    def ensure_realtime_feed(self, supabase_url, supabase_key):
+        """Starts relaying Supabase realtime changes into this worker's broker."""
+        # Threads do not survive a fork, so each worker starts its own feed
+        if self._feed_pid == os.getpid():
+            return
+        with self._lock:
+            if self._feed_pid == os.getpid():
+                return
+            self._feed_pid = os.getpid()
+        threading.Thread(
+            target=self._run_realtime_feed,
+            args=(supabase_url, supabase_key),
+            name="supabase-realtime-feed",
+            daemon=True,
+        ).start()
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscriptions), "history": len(self._history)}
+
+    def _missed_since(self, last_event_id):
+        if last_event_id is None:
+            return []
+        pid, _, sequence = last_event_id.partition("-")
+        if pid != str(os.getpid()) or not sequence.isdigit():
+            return None  # Another worker's stream; nothing here says what was missed
+        sequence = int(sequence)
+        if self._history and self._history[0][0] > sequence + 1:
+            return None  # Some of the missed events are no longer kept
+        return [message for kept, message in self._history if kept > sequence]
+
+    def _generate(self, subscription, missed, heartbeat_interval):
+        try:
+            # Tell the browser to reconnect quickly, then catch it up
+            yield "retry: 3000\n\n"
+            if missed is None:
+                yield _format(None, "resync", {})
+            else:
+                for message in missed:
+                    yield _format(*message)
+            while not subscription.overflowed:
+                try:
+                    message = subscription.queue.get(timeout=heartbeat_interval)
+                except queue.Empty:
+                    # Keeps proxies (and Heroku's 55s idle limit) from closing the stream,
+                    # and lets a write error notice a client that is gone
+                    yield ": keepalive\n\n"
+                    continue
+                yield _format(*message)
+            yield _format(None, "resync", {})
+        finally:
+            with self._lock:
+                self._subscriptions.discard(subscription)
+
+    def _run_realtime_feed(self, supabase_url, supabase_key):
+        # realtime 1.0 speaks the table-topic protocol and runs its own event loop
+        from realtime.connection import Socket
+
+        host = supabase_url.split("://", 1)[-1].rstrip("/")
+        url = f"wss://{host}/realtime/v1/websocket?apikey={supabase_key}&vsn=1.0.0"
+        while True:
+            try:
+                asyncio.set_event_loop(asyncio.new_event_loop())
+                socket = Socket(url)
+                socket.connect()
+                socket.set_channel("realtime:public:activity_log").join().on(
+                    "INSERT", lambda payload: self.publish("activity", payload["record"])
+                ).on("UPDATE", lambda payload: self.publish("status", payload["record"]))
+                socket.set_channel("realtime:public:comments").join().on(
+                    "INSERT", lambda payload: self.publish("comment", payload["record"])
+                )
+                socket.listen()
+            except Exception as e:
+                logger.error(f"Supabase realtime feed failed, reconnecting: {e}")
+            time.sleep(10)
+
+
+def _format(event_id, event_type, data):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
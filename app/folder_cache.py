@@ -0,0 +1,249 @@
+# folder_cache.py
+import os
+import itertools
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+import dropbox
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_path(path):
+    """Lowercased Dropbox path with a leading slash, or "" for the root."""
+    path = (path or "").strip("/").lower()
+    return f"/{path}" if path else ""
+
+
+def entry_from_metadata(metadata):
+    entry = {
+        "name": metadata.name,
+        "path_lower": metadata.path_lower,
+        "path_display": metadata.path_display,
+        "type": "folder" if isinstance(metadata, dropbox.files.FolderMetadata) else "file",
+    }
+    if isinstance(metadata, dropbox.files.FileMetadata):
+        entry.update(
+            id=metadata.id,
+            rev=metadata.rev,
+            size=metadata.size,
+            content_hash=metadata.content_hash,
+            server_modified=metadata.server_modified,
+        )
+    return entry
+
+
+class _Listing:
+    def __init__(self):
+        self.entries = {}
+        self.cursor = None
+        self.refreshed_at = 0.0
+        self.stamp = None  # Changes whenever the entries do
+        self.lock = threading.Lock()
+
+
+class FolderCache:
+    """Caches direct children of Dropbox folders and refreshes them from their list cursor.
+
+    A stale listing is brought up to date with files_list_folder_continue, which only
+    returns what changed since the cursor was issued. With longpoll enabled a
+    background thread applies changes as Dropbox reports them, so listings never
+    need a refresh on the request path.
+    """
+
+    def __init__(self, max_folders, refresh_interval, longpoll=False):
+        self.max_folders = max_folders
+        self.refresh_interval = refresh_interval
+        self.longpoll = longpoll
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+        self._watching_since = None
+        self._stamps = itertools.count(1)  # Unique across listings, so eviction cannot reuse one
+        self._stats = {"hits": 0, "full_listings": 0, "incremental_refreshes": 0, "evictions": 0}
+
+    def list(self, dbx, path):
+        """Returns the cached children of path, refreshing them first if stale."""
+        return self.list_with_stamp(dbx, path)[0]
+
+    def list_with_stamp(self, dbx, path):
+        """Returns (children, change stamp) of path, refreshing them first if stale.
+
+        The stamp differs from any earlier one of path whenever the children do,
+        so callers deriving state from a listing can tell when to redo it.
+        """
+        key = normalize_path(path)
+        if self.longpoll:
+            self._ensure_watcher(dbx)
+
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None:
+                self._listings.move_to_end(key)
+
+        if listing is None:
+            listing = _Listing()
+            with listing.lock:
+                self._full_listing(dbx, key, listing)
+                result = list(listing.entries.values()), listing.stamp
+            self._store(key, listing)
+            return result
+
+        with listing.lock:
+            if self._is_fresh(listing):
+                self._stats["hits"] += 1
+            else:
+                try:
+                    self._refresh(dbx, key, listing)
+                except Exception as e:
+                    # Serve the last known listing rather than failing the page
+                    logger.error(f"Failed to refresh folder listing for {key!r}: {e}")
+            return list(listing.entries.values()), listing.stamp
+
+    def record_upload(self, dropbox_path, metadata=None):
+        """Adds an uploaded file, and any folders created for it, to cached listings."""
+        parts = dropbox_path.strip("/").split("/")
+        parent = ""
+        for depth, name in enumerate(parts):
+            child_path = f"{parent}/{name.lower()}"
+            is_file = depth == len(parts) - 1
+            with self._lock:
+                listing = self._listings.get(parent)
+            if listing is not None:
+                with listing.lock:
+                    if is_file or child_path not in listing.entries:
+                        listing.stamp = next(self._stamps)
+                    if is_file:
+                        listing.entries[child_path] = (
+                            entry_from_metadata(metadata)
+                            if metadata is not None
+                            else {
+                                "name": name,
+                                "path_lower": child_path,
+                                "path_display": "/" + "/".join(parts),
+                                "type": "file",
+                                "server_modified": datetime.utcnow(),
+                            }
+                        )
+                    elif child_path not in listing.entries:
+                        listing.entries[child_path] = {
+                            "name": name,
+                            "path_lower": child_path,
+                            "path_display": "/" + "/".join(parts[: depth + 1]),
+                            "type": "folder",
+                        }
+            parent = child_path
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "folders": len(self._listings),
+                "longpoll": self._watching_since is not None,
+            }
+
+    def _is_fresh(self, listing):
+        # Once the watcher runs it keeps every listing refreshed after it started current
+        watching_since = self._watching_since
+        if watching_since is not None and listing.refreshed_at >= watching_since:
+            return True
+        return time.monotonic() - listing.refreshed_at < self.refresh_interval
+
+    def _store(self, key, listing):
+        with self._lock:
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_folders:
+                self._listings.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def _full_listing(self, dbx, key, listing):
+        result = dbx.files_list_folder(key)
+        entries = {}
+        while True:
+            for metadata in result.entries:
+                entries[metadata.path_lower] = entry_from_metadata(metadata)
+            if not result.has_more:
+                break
+            result = dbx.files_list_folder_continue(result.cursor)
+        listing.entries = entries
+        listing.stamp = next(self._stamps)
+        listing.cursor = result.cursor
+        listing.refreshed_at = time.monotonic()
+        self._stats["full_listings"] += 1
+
+    def _refresh(self, dbx, key, listing):
+        try:
+            result = dbx.files_list_folder_continue(listing.cursor)
+            while True:
+                if result.entries:
+                    self._apply(listing, result.entries)
+                    listing.stamp = next(self._stamps)
+                if not result.has_more:
+                    break
+                result = dbx.files_list_folder_continue(result.cursor)
+        except dropbox.exceptions.ApiError as e:
+            if isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset():
+                self._full_listing(dbx, key, listing)
+                return
+            raise
+        listing.cursor = result.cursor
+        listing.refreshed_at = time.monotonic()
+        self._stats["incremental_refreshes"] += 1
+
+    @staticmethod
+    def _apply(listing, changes):
+        for metadata in changes:
+            if isinstance(metadata, dropbox.files.DeletedMetadata):
+                listing.entries.pop(metadata.path_lower, None)
+            else:
+                listing.entries[metadata.path_lower] = entry_from_metadata(metadata)
+
+    def _ensure_watcher(self, dbx):
+        # Threads do not survive a fork, so each worker starts its own watcher
+        if self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(
+            target=self._watch, args=(dbx,), name="dropbox-folder-longpoll", daemon=True
+        ).start()
+
+    def _watch(self, dbx):
+        while True:
+            try:
+                watching_since = time.monotonic()
+                cursor = dbx.files_list_folder_get_latest_cursor("", recursive=True).cursor
+                self._watching_since = watching_since
+                while True:
+                    poll = dbx.files_list_folder_longpoll(cursor, timeout=30)
+                    if poll.changes:
+                        cursor = self._apply_recursive_changes(dbx, cursor)
+                    if poll.backoff:
+                        time.sleep(poll.backoff)
+            except Exception as e:
+                logger.error(f"Folder longpoll watcher failed, listings fall back to polling: {e}")
+                self._watching_since = None
+                time.sleep(30)
+
+    def _apply_recursive_changes(self, dbx, cursor):
+        result = dbx.files_list_folder_continue(cursor)
+        while True:
+            for metadata in result.entries:
+                parent = metadata.path_lower.rsplit("/", 1)[0]
+                with self._lock:
+                    listing = self._listings.get(parent)
+                    if isinstance(metadata, dropbox.files.DeletedMetadata):
+                        self._listings.pop(metadata.path_lower, None)
+                if listing is not None:
+                    with listing.lock:
+                        self._apply(listing, [metadata])
+                        listing.stamp = next(self._stamps)
+            if not result.has_more:
+                return result.cursor
+            result = dbx.files_list_folder_continue(result.cursor)
@@ -0,0 +1,280 @@
+# folder_upload.py
+import os
+import time
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import dropbox
+
+from .upload_stream import ContentHasher, UploadSessionWriter
+
+logger = logging.getLogger(__name__)
+
+# Dropbox accepts at most this many entries per upload_session/finish_batch call
+FINISH_BATCH_LIMIT = 1000
+
+
+class _Entry:
+    def __init__(self, dropbox_path, start):
+        self.dropbox_path = dropbox_path
+        self.start = start  # Where the file's bytes begin in the uploader's local copy
+        self.bytes_received = 0
+        self.content_hash = None
+        self.writer = None
+        self.future = None
+        self.copy_from = None  # Existing file with the same content
+        self.metadata = None
+        self.error = None
+
+
+class BatchFolderUploader:
+    """Uploads many files on a bounded pool and commits them with one batch finish.
+
+    Files are appended to one local temporary file as they arrive and each is
+    sent from there into its own upload session on the pool, so the request only
+    waits for local writes and several files are in flight at once. finish() then
+    commits all sessions together, polls the batch job for per-file results and
+    uploads only the files that failed again from the local copy, which is kept
+    until then. Memory is bounded by the chunks in flight; the copy takes as much
+    disk as the folder.
+
+    find_duplicate(dropbox_path, content_hash), if given, is asked about every
+    file once it has been received. A file it names an existing copy for is not sent
+    at all; it is copied server-side at finish(), or left out entirely when
+    copy_duplicates is false.
+    """
+
+    def __init__(
+        self,
+        dbx,
+        chunk_size,
+        spill_dir,
+        workers,
+        commit_retries=3,
+        poll_interval=1,
+        find_duplicate=None,
+        copy_duplicates=True,
+    ):
+        self.dbx = dbx
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.commit_retries = commit_retries
+        self.poll_interval = poll_interval
+        self.find_duplicate = find_duplicate
+        self.copy_duplicates = copy_duplicates
+        self._retries = 0
+        self._entries = []
+        self._replaced_writers = []
+        self._copy = tempfile.TemporaryFile(dir=spill_dir)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        # Bounds how many received files may wait for a worker
+        self._slots = threading.BoundedSemaphore(workers * 2)
+
+    def add(self, stream, dropbox_path):
+        """Copies a file locally and sends it into a new upload session on the pool."""
+        entry = _Entry(dropbox_path, self._copy.tell())
+        self._entries.append(entry)
+        hasher = ContentHasher()
+        while True:
+            data = stream.read(self.chunk_size)
+            if not data:
+                break
+            hasher.update(data)
+            self._copy.write(data)
+            entry.bytes_received += len(data)
+        # The pool reads the copy through its descriptor, past Python's buffer
+        self._copy.flush()
+        entry.content_hash = hasher.hexdigest()
+        if self.find_duplicate is not None:
+            entry.copy_from = self.find_duplicate(dropbox_path, entry.content_hash)
+            if entry.copy_from is not None:
+                # Never sent, so its bytes are not needed
+                self._copy.seek(entry.start)
+                self._copy.truncate()
+                return
+        self._slots.acquire()
+        entry.future = self._executor.submit(self._upload, entry)
+        entry.future.add_done_callback(lambda _: self._slots.release())
+
+    def finish(self):
+        """Commits every uploaded file; returns (metadata by path, failed paths).
+
+        Copied duplicates count as uploaded; skipped ones are in neither result.
+        """
+        try:
+            if self.copy_duplicates:
+                self._copy_duplicates([e for e in self._entries if e.copy_from is not None])
+            pending = []
+            for entry in self._entries:
+                if entry.copy_from is not None:
+                    continue
+                try:
+                    entry.future.result()
+                    pending.append(entry)
+                except Exception as e:
+                    entry.error = e
+                    if self._reupload(entry):
+                        pending.append(entry)
+
+            for attempt in range(self.commit_retries):
+                if not pending:
+                    break
+                if attempt:
+                    self._retries += len(pending)
+                    time.sleep(2**attempt)  # Exponential backoff
+                failed = []
+                for start in range(0, len(pending), FINISH_BATCH_LIMIT):
+                    batch = pending[start : start + FINISH_BATCH_LIMIT]
+                    try:
+                        results = self._commit_batch(batch)
+                    except Exception as e:
+                        logger.error(f"Batch commit of {len(batch)} files failed: {e}")
+                        failed.extend(batch)
+                        continue
+                    for entry, result in zip(batch, results):
+                        if result.is_success():
+                            entry.metadata = result.get_success()
+                            entry.error = None
+                            continue
+                        entry.error = result.get_failure()
+                        logger.error(f"Failed to commit {entry.dropbox_path}: {entry.error}")
+                        # A session that no longer exists has to be uploaded again
+                        if entry.error.is_lookup_failed() and not self._reupload(entry):
+                            continue
+                        failed.append(entry)
+                pending = failed
+        finally:
+            self._executor.shutdown(wait=False)
+            self._copy.close()
+
+        uploaded = {e.dropbox_path: e.metadata for e in self._entries if e.metadata is not None}
+        failed_paths = [
+            e.dropbox_path
+            for e in self._entries
+            if e.metadata is None and (e.copy_from is None or self.copy_duplicates)
+        ]
+        return uploaded, failed_paths
+
+    def discard(self):
+        """Abandons the upload: queued files are dropped, those in flight end unused."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._copy.close()
+        for entry in self._entries:
+            if entry.writer is not None:
+                entry.writer.discard()
+
+    @property
+    def duplicates(self):
+        """Existing file each duplicate was matched with, by destination path."""
+        return {e.dropbox_path: e.copy_from for e in self._entries if e.copy_from is not None}
+
+    @property
+    def bytes_received(self):
+        return sum(e.bytes_received for e in self._entries)
+
+    @property
+    def bytes_sent(self):
+        writers = self._replaced_writers + [e.writer for e in self._entries if e.writer]
+        return sum(writer.bytes_sent for writer in writers)
+
+    @property
+    def retries(self):
+        writers = self._replaced_writers + [e.writer for e in self._entries if e.writer]
+        return self._retries + sum(writer.retries for writer in writers)
+
+    def _upload(self, entry):
+        if entry.writer is not None:
+            self._replaced_writers.append(entry.writer)
+        entry.writer = UploadSessionWriter(self.dbx, self.chunk_size, self.spill_dir)
+        # Positional reads, so the request thread can keep appending meanwhile
+        descriptor = self._copy.fileno()
+        sent = 0
+        while sent < entry.bytes_received:
+            data = os.pread(
+                descriptor,
+                min(self.chunk_size, entry.bytes_received - sent),
+                entry.start + sent,
+            )
+            if not data:
+                raise OSError(f"Local copy of {entry.dropbox_path} ends early")
+            entry.writer.write(data)
+            sent += len(data)
+        entry.writer.close()
+
+    def _reupload(self, entry):
+        self._retries += 1
+        try:
+            self._upload(entry)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to re-upload {entry.dropbox_path}: {e}")
+            entry.error = e
+            return False
+
+    def _copy_duplicates(self, entries):
+        for attempt in range(self.commit_retries):
+            if not entries:
+                return
+            if attempt:
+                self._retries += len(entries)
+                time.sleep(2**attempt)  # Exponential backoff
+            failed = []
+            for start in range(0, len(entries), FINISH_BATCH_LIMIT):
+                batch = entries[start : start + FINISH_BATCH_LIMIT]
+                try:
+                    results = self._copy_batch(batch)
+                except Exception as e:
+                    logger.error(f"Batch copy of {len(batch)} files failed: {e}")
+                    failed.extend(batch)
+                    continue
+                for entry, result in zip(batch, results):
+                    if result.is_success():
+                        entry.metadata = result.get_success()
+                        continue
+                    # Usually the original is gone; there is nothing left to send
+                    # instead, so the file fails
+                    entry.error = result.get_failure()
+                    logger.error(
+                        f"Failed to copy {entry.copy_from} to {entry.dropbox_path}: {entry.error}"
+                    )
+            entries = failed
+
+    def _copy_batch(self, batch):
+        launch = self.dbx.files_copy_batch_v2(
+            [
+                dropbox.files.RelocationPath(from_path=entry.copy_from, to_path=entry.dropbox_path)
+                for entry in batch
+            ]
+        )
+        if launch.is_complete():
+            return launch.get_complete().entries
+
+        job_id = launch.get_async_job_id()
+        while True:
+            status = self.dbx.files_copy_batch_check_v2(job_id)
+            if status.is_complete():
+                return status.get_complete().entries
+            time.sleep(self.poll_interval)
+
+    def _commit_batch(self, batch):
+        finish_args = [
+            dropbox.files.UploadSessionFinishArg(
+                cursor=dropbox.files.UploadSessionCursor(
+                    session_id=entry.writer.session_id, offset=entry.writer.offset
+                ),
+                commit=dropbox.files.CommitInfo(path=entry.dropbox_path, mute=True),
+            )
+            for entry in batch
+        ]
+        launch = self.dbx.files_upload_session_finish_batch(finish_args)
+        if launch.is_complete():
+            return launch.get_complete().entries
+
+        job_id = launch.get_async_job_id()
+        while True:
+            status = self.dbx.files_upload_session_finish_batch_check(job_id)
+            if status.is_complete():
+                return status.get_complete().entries
+            time.sleep(self.poll_interval)
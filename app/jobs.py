@@ -0,0 +1,220 @@
+# jobs.py
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Finished job records are only useful to a client polling for the result
+JOB_RECORD_LIFETIME = 24 * 60 * 60
+
+
+class TransferJob:
+    """Progress of one background transfer.
+
+    Writers and uploaders attached with track() are read live for their byte and
+    retry counters, so progress moves while chunks are still in flight.
+    """
+
+    def __init__(self, kind, user_email, name):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_email = user_email
+        self.name = name
+        self.status = "receiving"
+        self.files_total = 0
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_deduplicated = 0  # Copied or skipped as known content; also in files_done
+        self.error = None
+        self.created_at = time.time()
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def track(self, source):
+        """Adds an object with bytes_received, bytes_sent and retries counters.
+
+        Its discard() is called if the job fails before reaching the pool.
+        """
+        with self._lock:
+            self._sources.append(source)
+
+    def discard(self):
+        with self._lock:
+            sources = list(self._sources)
+        for source in sources:
+            try:
+                source.discard()
+            except Exception as e:
+                logger.error(f"Failed to discard an upload of transfer job {self.id}: {e}")
+
+    def to_dict(self):
+        with self._lock:
+            sources = list(self._sources)
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "user_email": self.user_email,
+            "name": self.name,
+            "status": self.status,
+            "bytes_received": sum(source.bytes_received for source in sources),
+            "bytes_sent": sum(source.bytes_sent for source in sources),
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_failed": self.files_failed,
+            "files_deduplicated": self.files_deduplicated,
+            "retries": sum(source.retries for source in sources),
+            "error": self.error,
+            "created_at": self.created_at,
+        }
+
+
+class TransferJobQueue:
+    """Runs transfers on a worker pool of their own, away from the request workers.
+
+    Live jobs are read from memory. Every state change is also written to a JSON
+    record on local disk, and the progress of live jobs every progress_interval
+    seconds, so a status request that lands on another gunicorn worker still
+    sees the job and its progress.
+    """
+
+    def __init__(self, workers, directory, progress_interval=2):
+        self.workers = workers
+        self.directory = directory
+        self.progress_interval = progress_interval
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.RLock()
+        self._executor = None
+        self._executor_pid = None
+        self._writer_pid = None
+
+    def create(self, kind, user_email, name):
+        os.makedirs(self.directory, exist_ok=True)
+        self.purge_expired()
+        self._ensure_progress_writer()
+        job = TransferJob(kind, user_email, name)
+        with self._lock:
+            self._jobs[job.id] = job
+        self.save(job)
+        return job
+
+    def submit(self, app, job, work):
+        """Runs work(job) on the pool inside an app context of app."""
+        job.status = "queued"
+        self.save(job)
+        self._get_executor().submit(self._run, app, job, work)
+
+    def fail(self, job, error):
+        """Ends a job that never reached the pool, e.g. when its request broke off.
+
+        Whatever the job had opened is discarded: unsent data, spill files and
+        upload threads. Sessions already started simply expire unused.
+        """
+        job.discard()
+        job.status = "failed"
+        job.error = str(error)
+        self._finish(job)
+
+    def get(self, job_id):
+        """Returns the job's progress as a dict, or None if it is unknown."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, job):
+        # Write then rename so readers never see a half-written record
+        path = self._path(job.id)
+        with self._save_lock:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(f"{path}.tmp", path)
+
+    def purge_expired(self):
+        cutoff = time.time() - JOB_RECORD_LIFETIME
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _run(self, app, job, work):
+        job.status = "running"
+        self.save(job)
+        try:
+            with app.app_context():
+                work(job)
+            job.status = "failed" if job.files_failed else "done"
+        except Exception as e:
+            logger.exception(f"Transfer job {job.id} failed")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        # The progress writer must not put an older record back after this one
+        with self._save_lock:
+            self.save(job)
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+    def _get_executor(self):
+        # Threads do not survive a fork, so each worker gets its own pool
+        if self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="transfer-job"
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _ensure_progress_writer(self):
+        # Threads do not survive a fork, so each worker starts its own writer
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(
+            target=self._write_progress, name="transfer-job-progress", daemon=True
+        ).start()
+
+    def _write_progress(self):
+        written = {}
+        while True:
+            time.sleep(self.progress_interval)
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                with self._save_lock:
+                    with self._lock:
+                        if job.id not in self._jobs:
+                            continue  # Finished; its final record is written
+                    record = job.to_dict()
+                    if written.get(job.id) == record:
+                        continue
+                    try:
+                        self.save(job)
+                        written[job.id] = record
+                    except OSError as e:
+                        logger.error(f"Failed to write progress of transfer job {job.id}: {e}")
+            written = {job.id: written[job.id] for job in jobs if job.id in written}
+
+    def _path(self, job_id):
+        # Ids are generated here, but never let one escape the directory
+        return os.path.join(self.directory, f"{os.path.basename(job_id)}.json")
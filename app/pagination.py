@@ -0,0 +1,79 @@
+# pagination.py
+import json
+import base64
+import binascii
+
+
+def encode_cursor(*values):
+    """Opaque, URL-safe cursor holding the sort key of the last row on a page."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the values in a cursor, or None if it is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    return values if isinstance(values, list) and len(values) == 2 else None
+
+
+def keyset_page(query, sort_column, cursor, limit, desc=True):
+    """Runs a PostgREST query one page at a time, ordered on (sort_column, id).
+
+    Rather than an offset, each page starts after the sort key of the last row of
+    the previous one, so the database seeks straight to it however deep the page
+    is. Nulls in sort_column sort above every value, as Postgres does by default:
+    last in ascending order, first in descending. Returns (rows, cursor for the
+    next page or None).
+    """
+    query = query.order(sort_column, desc=desc, nullsfirst=desc).order("id", desc=desc)
+    position = decode_cursor(cursor)
+    if position is not None:
+        query = query.or_(_after(sort_column, *position, desc=desc))
+
+    # One extra row tells whether another page follows
+    return next_page(query.limit(limit + 1).execute().data, sort_column, limit)
+
+
+def keyset_params(sort_column, cursor, limit, desc=True):
+    """keyset_page() as PostgREST query parameters, for requests built by hand.
+
+    Asks for limit + 1 rows; next_page() turns them into the page and its cursor.
+    """
+    direction = "desc" if desc else "asc"
+    nulls = "nullsfirst" if desc else "nullslast"
+    params = [
+        ("order", f"{sort_column}.{direction}.{nulls},id.{direction}"),
+        ("limit", str(limit + 1)),
+    ]
+    position = decode_cursor(cursor)
+    if position is not None:
+        params.append(("or", f"({_after(sort_column, *position, desc=desc)})"))
+    return params
+
+
+def next_page(rows, sort_column, limit):
+    """Splits up to limit + 1 rows into (page, cursor for the next page or None)."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][sort_column], rows[-1]["id"])
+
+
+def _after(sort_column, value, row_id, desc):
+    """PostgREST or= filter for the rows that follow (value, row_id)."""
+    op = "lt" if desc else "gt"
+    tie = f'id.{op}."{row_id}"'
+    if value is None:
+        # Values only follow the nulls when walking down from them
+        return f"and({sort_column}.is.null,{tie})" + (
+            f",{sort_column}.not.is.null" if desc else ""
+        )
+    # Quoted so timestamps and other values with reserved characters pass intact
+    return (
+        f'{sort_column}.{op}."{value}",and({sort_column}.eq."{value}",{tie})'
+        + ("" if desc else f",{sort_column}.is.null")
+    )
@@ -0,0 +1,80 @@
+# resumable.py
+import os
+import json
+import time
+import uuid
+import fcntl
+from contextlib import contextmanager
+
+# Dropbox upload sessions expire after 7 days, so older state is useless
+SESSION_LIFETIME = 7 * 24 * 60 * 60
+
+
+class ResumableUploadStore:
+    """Keeps resumable upload state on local disk so any worker can continue an upload."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self, **state):
+        self.purge_expired()
+        state.update(id=uuid.uuid4().hex, offset=0, created_at=time.time())
+        self.save(state)
+        return state
+
+    def get(self, upload_id):
+        try:
+            with open(self._path(upload_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, state):
+        # Write then rename so readers never see a half-written file
+        path = self._path(state["id"])
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, upload_id):
+        for path in (self._path(upload_id), f"{self._path(upload_id)}.lock"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def locked(self, upload_id):
+        """Serializes work on one upload across threads and worker processes.
+
+        Yields the upload's state, or None for an unknown or expired id.
+        """
+        # Unknown ids are answered without leaving a lock file behind
+        if not os.path.exists(self._path(upload_id)):
+            yield None
+            return
+        with open(f"{self._path(upload_id)}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield self.get(upload_id)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def purge_expired(self):
+        cutoff = time.time() - SESSION_LIFETIME
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".json"):
+                if os.path.getmtime(path) < cutoff:
+                    self.delete(name[: -len(".json")])
+            elif name.endswith(".json.lock") and not os.path.exists(path[: -len(".lock")]):
+                # Left by a lock taken while the upload was being deleted
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _path(self, upload_id):
+        # Ids are generated here, but never let one escape the directory
+        return os.path.join(self.directory, f"{os.path.basename(upload_id)}.json")
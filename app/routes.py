@@ -5,48 +5,57 @@ from flask import (
     url_for,
     flash,
     current_app,
-    url_for,
     session,
-    send_file,
     jsonify,
-    Flask,
     Response,
 )
 from flask_login import login_required, login_user, current_user, logout_user
 from .services import (
-    dropbox_upload_file,
     list_folders,
     dropbox_connect,
     get_supabase,
-    list_files,
+    get_auth_supabase,
     download_file,
-    get_activity_log,
-    get_supabase,
-    log_activity,
-    get_comments_by_activity_id,
+    comments_validator,
+    get_folder_validator,
     add_comment_to_activity,
     get_image_url,
+    get_thumbnail,
+    thumbnail_store,
+    event_broker,
     add_assignment_to_database,
-    get_assignments,
-    get_versions_info,
+    parse_assignment_filters,
     list_users,
     get_assignment_by_id,
-    update_assignment_status,
     list_folders_files,
+    get_folder_tree,
+    search_assets,
+    get_asset_versions,
     update_dashboard_status,
     download_folder_as_zip,
-    process_and_upload_file,
-    process_and_upload_folder,
+    get_cache_stats,
+    request_parts,
+    submit_assignment_upload,
+    get_transfer_job,
+    stream_upload_request,
+    resumable_upload_store,
+    resumable_upload_status,
+    start_resumable_upload,
+    deduplicate_resumable_upload,
+    append_resumable_chunk,
+    finish_resumable_upload,
 )
+from . import async_services
+from .conditional import conditional, async_conditional
+from .events import TooManySubscribers
 from .models import User
-from werkzeug.utils import secure_filename
-import os
-from supabase import create_client, Client
-from io import BytesIO
+from supabase import Client
 from urllib.parse import unquote
 import dropbox
-import zipfile
-from datetime import datetime
+import time
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def init_routes(app):
@@ -61,42 +70,137 @@ def init_routes(app):
 
     @app.route("/dashboard")
     @login_required
-    def dashboard():
-        supabase = get_supabase()
-        activity_log = get_activity_log(supabase)
-        attention_required = [
-            log for log in activity_log if log["status"] == "Action Needed"
-        ]
-        completed = [log for log in activity_log if log["status"] == "Approved"]
-        return render_template(
-            "dashboard.html",
-            activity_log=activity_log,
-            attention_required=attention_required,
-            completed=completed,
+    async def dashboard():
+        config = current_app.config
+        attention_cursor = request.args.get("attention_cursor")
+        approved_cursor = request.args.get("approved_cursor")
+        # New entries raise the newest id and approvals move counts between the
+        # statuses, so these cheap queries decide whether the pages are needed
+        counts, newest_id = await async_services.gather(
+            async_services.get_activity_counts(config, ["Action Needed", "Approved"]),
+            async_services.get_newest_activity_id(config),
+        )
+        validator = (
+            None
+            if newest_id is None or None in counts.values()
+            else [current_user.get_id(), attention_cursor, approved_cursor, counts, newest_id]
         )
 
+        async def render():
+            (
+                (attention_required, next_attention_cursor),
+                (completed, next_approved_cursor),
+            ) = await async_services.gather(
+                async_services.get_activity_page(config, "Action Needed", attention_cursor),
+                async_services.get_activity_page(config, "Approved", approved_cursor),
+            )
+            return render_template(
+                "dashboard.html",
+                attention_required=attention_required,
+                completed=completed,
+                counts=counts,
+                attention_cursor=attention_cursor,
+                approved_cursor=approved_cursor,
+                next_attention_cursor=next_attention_cursor,
+                next_approved_cursor=next_approved_cursor,
+            )
+
+        return await async_conditional(render, validator, page=True)
+
     @app.route("/assignments", methods=["GET"])
     @app.route("/assignments/<path:asset_path>", methods=["GET"])
     @login_required
-    def assignments(asset_path=None):
-        supabase = get_supabase()
-        assignments_data = get_assignments(supabase)
-        user_data = list_users()
-
-        return render_template(
-            "assignments.html",
-            assignments=assignments_data,
-            users=user_data,
-            asset_path=asset_path,
+    async def assignments(asset_path=None):
+        config = current_app.config
+        filters = parse_assignment_filters(request.args)
+        validator = await async_services.get_assignments_validator(
+            config, filters, current_user.email
+        )
+
+        async def render():
+            assignments_data, next_cursor = await async_services.get_assignments_page(
+                config, filters, current_user.email
+            )
+            user_data = list_users()
+            return render_template(
+                "assignments.html",
+                assignments=assignments_data,
+                next_cursor=next_cursor,
+                filters=filters,
+                users=user_data,
+                asset_path=asset_path,
+            )
+
+        return await async_conditional(
+            render, validator and [validator, asset_path], page=True
         )
 
+    @app.route("/get_assignments")
+    @login_required
+    async def get_assignments():
+        config = current_app.config
+        filters = parse_assignment_filters(request.args)
+        cursor = request.args.get("cursor")
+        validator = await async_services.get_assignments_validator(
+            config, filters, current_user.email
+        )
+
+        async def build():
+            assignments_data, next_cursor = await async_services.get_assignments_page(
+                config, filters, current_user.email, cursor
+            )
+            return jsonify({"assignments": assignments_data, "next_cursor": next_cursor})
+
+        return await async_conditional(build, validator and [validator, cursor])
+
     @app.route("/get_comments/<string:activity_id>")
-    def get_comments(activity_id):
+    async def get_comments(activity_id):
 
-        supabase = get_supabase()
-        comments = get_comments_by_activity_id(supabase, activity_id)
-        print(comments)
-        return jsonify(comments)
+        comments = await async_services.get_comments_by_activity_id(
+            current_app.config, activity_id
+        )
+        if comments is None:
+            return jsonify(comments)
+        return conditional(lambda: jsonify(comments), comments_validator(comments))
+
+    @app.route("/get_comments")
+    @login_required
+    async def get_comments_batch():
+        activity_ids = [a for a in request.args.get("ids", "").split(",") if a]
+        if not activity_ids:
+            return jsonify({"status": "error", "message": "No activity ids provided"}), 400
+        if len(activity_ids) > 200:
+            return jsonify({"status": "error", "message": "At most 200 activity ids"}), 400
+
+        comments = await async_services.get_comments_for_activities(
+            current_app.config, activity_ids
+        )
+        if comments is None:
+            return jsonify({"status": "error", "message": "Error fetching comments"}), 500
+        validator = {
+            activity_id: comments_validator(activity_comments)
+            for activity_id, activity_comments in comments.items()
+        }
+        return conditional(lambda: jsonify(comments), validator)
+
+    @app.route("/events")
+    @login_required
+    def events():
+        config = current_app.config
+        if config["EVENT_STREAM_REALTIME"]:
+            event_broker.ensure_realtime_feed(config["SUPABASE_URL"], config["SUPABASE_KEY"])
+        try:
+            stream = event_broker.stream(
+                request.headers.get("Last-Event-ID"), config["EVENT_STREAM_HEARTBEAT"]
+            )
+        except TooManySubscribers:
+            # The dashboard still works without live updates
+            return jsonify({"message": "Too many open event streams"}), 503
+        return Response(
+            stream,
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
 
     @app.route("/add_comment", methods=["POST"])
     def add_comment():
@@ -150,30 +254,25 @@ def init_routes(app):
             flash("Invalid or already completed assignment.", "error")
             return redirect(url_for("assignments"))
 
-        uploaded_file = request.files.get("file")
-        if uploaded_file and uploaded_file.filename:
-            filename = secure_filename(uploaded_file.filename)
-            temp_dir = os.path.join(current_app.root_path, "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            temp_file_path = os.path.join(temp_dir, filename)
-
-            uploaded_file.save(temp_file_path)
-
-            # Decode the URL-encoded file path and ensure it starts with '/'
-            decoded_file_path = unquote(asset_path)
-            dropbox_file_path = f"/{decoded_file_path}"  # Construct full Dropbox path
-            if dropbox_upload_file(temp_file_path, dropbox_file_path):
-                os.remove(temp_file_path)
-                update_assignment_status(
-                    supabase, assignment_id, True
-                )  # Set assignment as completed
-                print("Assignment submitted successfully.")
+        job = None
+        if request.mimetype == "multipart/form-data":
+            dbx = dropbox_connect()
+            for part in request_parts():
+                if part.name != "file" or not part.filename or job is not None:
+                    continue
 
-            else:
-                os.remove(temp_file_path)
-                print("Error uploading file to Dropbox.")
-        else:
+                # Decode the URL-encoded file path and ensure it starts with '/'
+                decoded_file_path = unquote(asset_path)
+                dropbox_file_path = f"/{decoded_file_path}"  # Construct full Dropbox path
+                # The assignment is marked completed once the job has committed the file
+                job = submit_assignment_upload(assignment_id, part.stream, dropbox_file_path, dbx)
+
+        if job is None:
             flash("No file was uploaded.", "error")
+        elif request.accept_mimetypes.best == "application/json":
+            return jsonify(job.to_dict()), 202
+        else:
+            flash("Submission received. The assignment is completed once the upload finishes.")
 
         return redirect(url_for("assignments"))
 
@@ -184,61 +283,162 @@ def init_routes(app):
         folder_options = list_folders(dbx)
     
         if request.method == "POST":
-            files = request.files.getlist("file")
-            directory_files = request.files.getlist("directory")
-            selected_folder = request.form.get("folder")
-    
-            if not files and not directory_files:
+            if request.mimetype != "multipart/form-data":
                 return jsonify({'message': 'No files were uploaded.'}), 400
-    
-            # Ensure we process files and directories separately
-            any_files_uploaded = False
-    
-            # Process single files
-            if files and files[0].filename:
-                any_files_uploaded = True
-                for uploaded_file in files:
-                    print(uploaded_file)
-                    process_and_upload_file(uploaded_file, selected_folder, folder_options, dbx)
-    
-            # Process directory files
-            if directory_files and directory_files[0].filename:
-                any_files_uploaded = True
-                process_and_upload_folder(directory_files, selected_folder, folder_options, dbx)
-    
-            if any_files_uploaded:
-                return render_template("upload_success.html", message='Files uploaded successfully.')
+
+            # Files are sent on to Dropbox while the request body is still arriving
+            files_received, job = stream_upload_request(folder_options, dbx)
+            if files_received is None:
+                return jsonify({'message': 'The folder must be sent before the files.'}), 400
+
+            if files_received:
+                # The job commits the files; poll /jobs/<job_id> for its progress
+                return jsonify(job.to_dict()), 202
             else:
-                return jsonify({'message': 'No files were processed.'}), 400
+                return jsonify({'message': 'No files were uploaded.'}), 400
     
-        return render_template("upload.html", folder_options=folder_options)
+        listing = get_folder_validator(dbx, "")
+        return conditional(
+            lambda: render_template("upload.html", folder_options=folder_options),
+            None if listing is None else [current_user.get_id(), listing],
+            page=True,
+        )
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    @login_required
+    def job_status(job_id):
+        job = get_transfer_job(job_id)
+        if not job or job["user_email"] != current_user.email:
+            return jsonify({"message": "Job not found"}), 404
+        return jsonify(job)
     
 
 
+    @app.route("/uploads", methods=["POST"])
+    @login_required
+    def start_upload():
+        data = request.get_json()
+        if not data:
+            return jsonify({"message": "No data provided"}), 400
+
+        dbx = dropbox_connect()
+        filename = data.get("filename")
+        folder = data.get("folder")
+        size = data.get("size")
+        if not filename or "." not in filename:
+            return jsonify({"message": "A filename with an extension is required"}), 400
+        if folder not in list_folders(dbx):
+            return jsonify({"message": "Unknown folder"}), 400
+        if not isinstance(size, int) or size < 0:
+            return jsonify({"message": "A file size is required"}), 400
+
+        # Clients that hashed the file first can skip sending content we already have.
+        # The hash is taken on trust: it only matches an existing version of the
+        # same asset in the same folder with the same size, which the client can
+        # read anyway, so a wrong hash at worst records a copy of that version.
+        content_hash = data.get("content_hash")
+        if isinstance(content_hash, str):
+            duplicate = deduplicate_resumable_upload(filename, folder, content_hash, size, dbx)
+            if duplicate is not None:
+                return jsonify({"message": "Identical content already uploaded", **duplicate})
+
+        upload = start_resumable_upload(filename, folder, size, dbx)
+        return jsonify(resumable_upload_status(upload)), 201
+
+    @app.route("/uploads/<upload_id>", methods=["GET"])
+    @login_required
+    def upload_status(upload_id):
+        upload = resumable_upload_store().get(upload_id)
+        if not upload or upload["user_email"] != current_user.email:
+            return jsonify({"message": "Upload not found"}), 404
+        return jsonify(resumable_upload_status(upload))
+
+    @app.route("/uploads/<upload_id>", methods=["PUT"])
+    @login_required
+    def append_upload(upload_id):
+        offset = request.args.get("offset", type=int)
+        length = request.content_length
+        if offset is None or length is None:
+            return jsonify({"message": "offset and Content-Length are required"}), 400
+        if length > current_app.config["UPLOAD_CHUNK_SIZE"]:
+            return jsonify({"message": "Chunk is larger than the advertised chunk_size"}), 413
+
+        with resumable_upload_store().locked(upload_id) as upload:
+            if not upload or upload["user_email"] != current_user.email:
+                return jsonify({"message": "Upload not found"}), 404
+            if offset != upload["offset"]:
+                # The client is out of step; tell it where to resume from
+                return jsonify(resumable_upload_status(upload)), 409
+            if offset + length > upload["size"]:
+                return jsonify({"message": "Chunk runs past the declared size"}), 400
+
+            try:
+                append_resumable_chunk(upload, request.get_data(cache=False), dropbox_connect())
+            except Exception as e:
+                logger.error(f"Error appending upload chunk: {e}")
+                return jsonify({"message": str(e)}), 502
+            return jsonify(resumable_upload_status(upload))
+
+    @app.route("/uploads/<upload_id>/finish", methods=["POST"])
+    @login_required
+    def finish_upload(upload_id):
+        with resumable_upload_store().locked(upload_id) as upload:
+            if not upload or upload["user_email"] != current_user.email:
+                return jsonify({"message": "Upload not found"}), 404
+            if upload["offset"] != upload["size"]:
+                return jsonify(resumable_upload_status(upload)), 409
+
+            try:
+                finish_resumable_upload(upload, dropbox_connect())
+            except Exception as e:
+                logger.error(f"Error finishing upload: {e}")
+                return jsonify({"message": str(e)}), 502
+            return jsonify({"message": "Upload complete", "path": upload["dropbox_path"]})
+
     @app.route("/download", methods=["GET", "POST"])
     @login_required
-    def download():
+    async def download():
         path = ""  # Define your root Dropbox path
-        dbx = dropbox_connect()
-        games = list_folders(dbx, path)
+        config = current_app.config
         selected_game = request.form.get("game")
-        assets = list_folders(dbx, f"{path}/{selected_game}") if selected_game else []
         selected_asset = request.form.get("asset") if "asset" in request.form else None
+        version_offset = max(request.form.get("offset", 0, type=int), 0)
+
+        async def render():
+            # The three lookups are independent, so run them at the same time
+            games, assets, (versions_info, more_versions) = await async_services.gather(
+                async_services.list_folders(config, path),
+                async_services.list_folders(config, f"{path}/{selected_game}")
+                if selected_game
+                else async_services.resolved([]),
+                async_services.get_versions_info(
+                    config, path, selected_game, selected_asset, version_offset
+                )
+                if selected_asset
+                else async_services.resolved(([], False)),
+            )
 
-        versions_info = (
-            get_versions_info(dbx, path, selected_game, selected_asset)
-            if selected_asset
-            else []
-        )
+            return render_template(
+                "download.html",
+                games=games,
+                selected_game=selected_game,
+                assets=assets,
+                selected_asset=selected_asset,
+                versions=versions_info,
+                previous_version_offset=max(version_offset - config["VERSION_PAGE_SIZE"], 0)
+                if version_offset
+                else None,
+                next_version_offset=version_offset + len(versions_info) if more_versions else None,
+            )
 
-        return render_template(
-            "download.html",
-            games=games,
-            selected_game=selected_game,
-            assets=assets,
-            selected_asset=selected_asset,
-            versions=versions_info,
-        )
+        # Only the game list is shown until a game is posted, and it is current
+        # as long as the root folder listing is
+        validator = None
+        if request.method == "GET":
+            listing = await async_services.get_folder_validator(config, path)
+            if listing is not None:
+                validator = [current_user.get_id(), listing]
+        return await async_conditional(render, validator, page=True)
 
     # @app.route("/download_file/<path:file_path>")
     # def download_file_route(file_path):
@@ -280,7 +480,7 @@ def init_routes(app):
         try:
             metadata = dbx.files_get_metadata(decoded_path)
             if isinstance(metadata, dropbox.files.FileMetadata):
-                return download_file(dbx, decoded_path)
+                return download_file(dbx, decoded_path, metadata)
             elif isinstance(metadata, dropbox.files.FolderMetadata):
                 return download_folder_as_zip(dbx, decoded_path, metadata.name)
             else:
@@ -296,9 +496,7 @@ def init_routes(app):
     def supabase_login():
         email = request.form["email"]
         password = request.form["password"]
-        supabase: Client = (
-            get_supabase()
-        )  # Assuming this returns a supabase client instance
+        supabase: Client = get_auth_supabase()  # Isolated so the user session is never shared
 
         try:
             u = supabase.auth.sign_in_with_password(
@@ -336,13 +534,83 @@ def init_routes(app):
     @app.route("/explorer")
     def explorer():
         dbx = dropbox_connect()
-        return render_template("explorer.html", files=list_folders_files(dbx, ""))
+        listing = get_folder_validator(dbx, "")
+        return conditional(
+            lambda: render_template("explorer.html", files=list_folders_files(dbx, "")),
+            None if listing is None else [current_user.get_id(), listing],
+            page=True,
+        )
 
     @app.route("/folder")
     def folder_contents():
         path = request.args.get("path", "")
         dbx = dropbox_connect()
-        return jsonify(list_folders_files(dbx, path))
+        return conditional(
+            lambda: jsonify(list_folders_files(dbx, path)), get_folder_validator(dbx, path)
+        )
+
+    @app.route("/folder_tree")
+    @login_required
+    def folder_tree():
+        path = request.args.get("path", "")
+        max_depth = min(
+            request.args.get("depth", current_app.config["FOLDER_TREE_MAX_DEPTH"], type=int),
+            current_app.config["FOLDER_TREE_MAX_DEPTH"],
+        )
+        max_entries = min(
+            request.args.get("limit", current_app.config["FOLDER_TREE_MAX_ENTRIES"], type=int),
+            current_app.config["FOLDER_TREE_MAX_ENTRIES"],
+        )
+        dbx = dropbox_connect()
+        try:
+            return jsonify(get_folder_tree(dbx, path, max(1, max_depth), max(1, max_entries)))
+        except dropbox.exceptions.ApiError as err:
+            logger.error(f"Failed to list folder tree of {path!r}: {err}")
+            return jsonify({"error": "Failed to list folder"}), 404
+
+    @app.route("/search")
+    @login_required
+    def search():
+        started = time.perf_counter()
+        results = search_assets(dropbox_connect(), request.args)
+        return jsonify(
+            {
+                "results": results,
+                "took_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+        )
+
+    @app.route("/versions")
+    @login_required
+    def versions():
+        if not request.args.get("game") or not request.args.get("asset"):
+            return jsonify({"error": "game and asset parameters are required"}), 400
+        result = get_asset_versions(dropbox_connect(), request.args)
+        if result is None:
+            return jsonify({"error": "since must be an ISO date or datetime"}), 400
+        return jsonify(result)
+
+    @app.route("/thumbnail")
+    @login_required
+    def thumbnail():
+        file_path = request.args.get("path")
+        if not file_path:
+            return jsonify({"error": "Path parameter is required"}), 400
+
+        requested_hash = request.args.get("v")
+        data, content_hash = get_thumbnail(dropbox_connect(), file_path, requested_hash)
+        if data is None:
+            return jsonify({"error": "No thumbnail available"}), 404
+
+        response = Response(data, mimetype=thumbnail_store.mimetype)
+        if requested_hash and requested_hash == content_hash:
+            # This URL always names the same revision, so browsers can keep it
+            response.headers["Cache-Control"] = (
+                f"private, max-age={current_app.config['THUMBNAIL_MAX_AGE']}, immutable"
+            )
+        else:
+            response.headers["Cache-Control"] = "private, no-cache"
+        return response
 
     @app.route("/preview_asset")
     @login_required
@@ -352,12 +620,19 @@ def init_routes(app):
             return jsonify({"error": "Path parameter is required"}), 400
 
         dbx = dropbox_connect()
+        # Links are cached until they near expiry and dropped when the file is
+        # replaced, so an unchanged link means an unchanged preview
         image_url = get_image_url(dbx, file_path)
         if image_url:
-            return jsonify({"url": image_url})
+            return conditional(lambda: jsonify({"url": image_url}), [file_path, image_url])
         else:
             return jsonify({"error": "Failed to get image URL"}), 404
 
+    @app.route("/cache_stats")
+    @login_required
+    def cache_stats():
+        return jsonify(get_cache_stats())
+
     @app.route('/reset', methods=['GET'])
     def reset():
         # Render the create password page; the token will be extracted by JavaScript
@@ -374,7 +649,7 @@ def init_routes(app):
         if not new_password or not access_token or not refresh_token:
             return jsonify({'message': 'New password, access token, and refresh token are required'}), 400
     
-        supabase = get_supabase()
+        supabase = get_auth_supabase()
         try:
             # Set the session using the access token and refresh token
             session_response = supabase.auth.set_session(access_token, refresh_token)
@@ -399,7 +674,7 @@ def init_routes(app):
 
     @app.route('/change_password', methods=['GET', 'POST'])
     def change_password():
-        supabase = get_supabase()
+        supabase = get_auth_supabase()
         if request.method == 'GET':
             return render_template('change_password.html')
 
@@ -0,0 +1,201 @@
+# search_index.py
+import bisect
+import threading
+import time
+import logging
+
+import dropbox
+
+logger = logging.getLogger(__name__)
+
+
+def _record(metadata):
+    path_lower = metadata.path_lower
+    name = metadata.name
+    is_file = isinstance(metadata, dropbox.files.FileMetadata)
+    return {
+        "name": name,
+        "path_lower": path_lower,
+        "path_display": metadata.path_display,
+        "type": "file" if is_file else "folder",
+        "game": path_lower.strip("/").split("/")[0],
+        "extension": name.rsplit(".", 1)[1].lower() if is_file and "." in name else "",
+        "server_modified": metadata.server_modified if is_file else None,
+    }
+
+
+class SearchIndex:
+    """In-memory index of every path in the Dropbox app folder.
+
+    The first search crawls the namespace with one recursive listing. Later
+    searches apply only what changed since the saved cursor, at most once per
+    refresh_interval. After a failed crawl or refresh, Dropbox is left alone for
+    retry_interval; until the first crawl succeeds, searches find nothing rather
+    than each waiting on another crawl. Prefix searches bisect a sorted name
+    list; substring searches scan names in memory.
+    """
+
+    def __init__(self, refresh_interval, retry_interval=60):
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self._entries = {}
+        self._sorted_names = None  # [(lowercased name, path_lower)], rebuilt after changes
+        self._cursor = None
+        self._refreshed_at = 0.0
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def search(
+        self,
+        dbx,
+        query="",
+        mode="substring",
+        game=None,
+        extension=None,
+        entry_type=None,
+        modified_after=None,
+        modified_before=None,
+        limit=50,
+    ):
+        """Returns up to limit matching entries, sorted by path."""
+        self._ensure_current(dbx)
+        query = query.lower()
+        with self._lock:
+            if mode == "prefix" and query:
+                candidates = self._prefix_matches(query)
+            else:
+                candidates = (
+                    entry
+                    for entry in self._entries.values()
+                    if query in entry["name"].lower()
+                )
+            results = []
+            for entry in candidates:
+                if game and entry["game"] != game.lower():
+                    continue
+                if extension and entry["extension"] != extension.lower().lstrip("."):
+                    continue
+                if entry_type and entry["type"] != entry_type:
+                    continue
+                modified = entry["server_modified"]
+                if modified_after and (modified is None or modified < modified_after):
+                    continue
+                if modified_before and (modified is None or modified >= modified_before):
+                    continue
+                results.append(entry)
+        results.sort(key=lambda entry: entry["path_lower"])
+        return results[:limit]
+
+    def record_upload(self, metadata):
+        """Adds an uploaded file, and any folders created for it, without a refresh."""
+        with self._lock:
+            self._entries[metadata.path_lower] = _record(metadata)
+            parts = metadata.path_display.strip("/").split("/")[:-1]
+            for depth in range(1, len(parts) + 1):
+                path_display = "/" + "/".join(parts[:depth])
+                if path_display.lower() not in self._entries:
+                    self._entries[path_display.lower()] = {
+                        "name": parts[depth - 1],
+                        "path_lower": path_display.lower(),
+                        "path_display": path_display,
+                        "type": "folder",
+                        "game": parts[0].lower(),
+                        "extension": "",
+                        "server_modified": None,
+                    }
+            self._sorted_names = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "age": time.monotonic() - self._refreshed_at if self._cursor else None,
+            }
+
+    def _prefix_matches(self, query):
+        if self._sorted_names is None:
+            self._sorted_names = sorted(
+                (entry["name"].lower(), path) for path, entry in self._entries.items()
+            )
+        start = bisect.bisect_left(self._sorted_names, (query,))
+        for name, path in self._sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            yield self._entries[path]
+
+    def _ensure_current(self, dbx):
+        if not self._due():
+            return
+        # The first crawl has to finish before anyone can search; after that one
+        # request refreshes while the others keep using the current index
+        if not self._refresh_lock.acquire(blocking=self._cursor is None):
+            return
+        try:
+            if not self._due():
+                return
+            if self._cursor is None:
+                self._crawl(dbx)
+            else:
+                self._refresh(dbx)
+            self._failed_at = None
+        except Exception as e:
+            logger.error(f"Failed to refresh search index: {e}")
+            self._failed_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def _due(self):
+        now = time.monotonic()
+        if now - self._refreshed_at < self.refresh_interval:
+            return False
+        return self._failed_at is None or now - self._failed_at >= self.retry_interval
+
+    def _crawl(self, dbx):
+        started = time.monotonic()
+        entries = {}
+        result = dbx.files_list_folder("", recursive=True)
+        while True:
+            for metadata in result.entries:
+                entries[metadata.path_lower] = _record(metadata)
+            if not result.has_more:
+                break
+            result = dbx.files_list_folder_continue(result.cursor)
+        with self._lock:
+            self._entries = entries
+            self._sorted_names = None
+            self._cursor = result.cursor
+            self._refreshed_at = time.monotonic()
+        logger.info(f"Indexed {len(entries)} paths in {time.monotonic() - started:.1f}s")
+
+    def _refresh(self, dbx):
+        try:
+            result = dbx.files_list_folder_continue(self._cursor)
+        except dropbox.exceptions.ApiError as e:
+            if isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset():
+                self._crawl(dbx)
+                return
+            raise
+        while True:
+            self._apply(result.entries)
+            if not result.has_more:
+                break
+            result = dbx.files_list_folder_continue(result.cursor)
+        with self._lock:
+            self._cursor = result.cursor
+            self._refreshed_at = time.monotonic()
+
+    def _apply(self, changes):
+        if not changes:
+            return
+        with self._lock:
+            for metadata in changes:
+                if isinstance(metadata, dropbox.files.DeletedMetadata):
+                    # A deleted folder takes everything below it along
+                    prefix = metadata.path_lower + "/"
+                    self._entries.pop(metadata.path_lower, None)
+                    for path in [p for p in self._entries if p.startswith(prefix)]:
+                        del self._entries[path]
+                else:
+                    self._entries[metadata.path_lower] = _record(metadata)
+            self._sorted_names = None
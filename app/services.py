@@ -1,31 +1,107 @@
 # Inside services.py
 import os
-from datetime import datetime
+import mimetypes
+from datetime import datetime, timezone
 import dropbox
 from config import Config
-import pathlib
-from flask import current_app, send_file, flash, redirect, url_for
-from supabase import create_client, Client
-from io import BytesIO
+from flask import (
+    current_app,
+    flash,
+    url_for,
+    request,
+    Response,
+    stream_with_context,
+)
 import re
 from dropbox.exceptions import ApiError
 from flask_login import current_user
 from werkzeug.utils import secure_filename
 import time
-import requests
-from dropbox.exceptions import HttpError
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from .dropbox_pool import get_dropbox_client, get_http_session
+from .supabase_pool import get_shared_client, create_auth_client
+from .cache import TTLCache
+from .folder_cache import FolderCache, normalize_path
+from .zipstream import list_files_recursive, stream_folder_zip
+from .upload_stream import (
+    MultipartStream,
+    call_with_retries,
+    open_upload_writer,
+)
+from .folder_upload import BatchFolderUploader
+from .resumable import ResumableUploadStore
+from .jobs import TransferJobQueue
+from .pagination import keyset_page
+from .activity import ActivityRecorder
+from .search_index import SearchIndex
+from .version_index import VersionIndex, parse_version_time
+from .thumbnails import ThumbnailStore
+from .events import EventBroker
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Dropbox temporary links live for four hours; entries expire well before that
+temporary_link_cache = TTLCache(
+    max_entries=Config.TEMPORARY_LINK_CACHE_SIZE, ttl=Config.TEMPORARY_LINK_CACHE_TTL
+)
+
+folder_cache = FolderCache(
+    max_folders=Config.FOLDER_CACHE_SIZE,
+    refresh_interval=Config.FOLDER_CACHE_REFRESH_INTERVAL,
+    longpoll=Config.FOLDER_CACHE_LONGPOLL,
+)
+
+# Subtrees are rebuilt after the folder refresh interval or the next upload
+folder_tree_cache = TTLCache(max_entries=100, ttl=Config.FOLDER_CACHE_REFRESH_INTERVAL)
+
+search_index = SearchIndex(
+    refresh_interval=Config.SEARCH_INDEX_REFRESH_INTERVAL,
+    retry_interval=Config.SEARCH_INDEX_RETRY_INTERVAL,
+)
+
+version_index = VersionIndex(
+    folder_cache,
+    max_folders=Config.VERSION_INDEX_SIZE,
+)
+
+thumbnail_store = ThumbnailStore(
+    Config.THUMBNAIL_CACHE_DIR,
+    max_bytes=Config.THUMBNAIL_CACHE_BYTES,
+    size=Config.THUMBNAIL_SIZE,
+    image_format=Config.THUMBNAIL_FORMAT,
+)
+
+event_broker = EventBroker(max_subscribers=Config.EVENT_STREAM_MAX_CLIENTS)
+
+
+def publish_events(event_type, rows):
+    """Tells this worker's open dashboards about stored rows."""
+    for row in rows:
+        event_broker.publish(event_type, row)
+
+
+comment_cache = TTLCache(max_entries=Config.COMMENT_CACHE_SIZE, ttl=Config.COMMENT_CACHE_TTL)
+
+activity_recorder = ActivityRecorder(
+    "activity_log",
+    max_queue=Config.ACTIVITY_QUEUE_SIZE,
+    batch_size=Config.ACTIVITY_BATCH_SIZE,
+    flush_interval=Config.ACTIVITY_FLUSH_INTERVAL,
+    on_written=lambda rows: publish_events("activity", rows),
+)
+
+transfer_jobs = TransferJobQueue(
+    workers=Config.TRANSFER_JOB_WORKERS,
+    directory=os.path.join(os.path.dirname(__file__), "temp", "jobs"),
+    progress_interval=Config.TRANSFER_JOB_PROGRESS_INTERVAL,
+)
+
 
 def dropbox_connect():
-    return dropbox.Dropbox(
-        oauth2_refresh_token=current_app.config["DROPBOX_OAUTH2_REFRESH_TOKEN"],
-        app_key=current_app.config["DROPBOX_APP_KEY"],
-        app_secret=current_app.config["DROPBOX_APP_SECRET"],
-    )
+    """Returns the worker's shared Dropbox client."""
+    return get_dropbox_client(current_app.config)
 
 
 def create_temp_dir(base_dir):
@@ -34,25 +110,100 @@ def create_temp_dir(base_dir):
     return temp_dir
 
 
-def get_versions_info(dbx, path, game, asset):
-    versions_paths = list_files(dbx, f"{path}/{game}/{asset}")
+def get_versions_info(dbx, path, game, asset, offset=0, limit=None):
+    """One page of an asset's versions with thumbnails, newest first.
+
+    Returns (versions, whether older versions follow).
+    """
+    try:
+        versions, has_more = version_index.history(
+            dbx, f"{path}/{game}/{asset}", offset, limit or Config.VERSION_PAGE_SIZE
+        )
+    except Exception as e:
+        logger.error(f"Failed to list versions of {game}/{asset}: {e}")
+        return [], False
+    thumbnail_urls = get_thumbnail_urls(
+        dbx,
+        {f"/{game}/{asset}/{version['filename']}": version["content_hash"] for version in versions},
+    )
     versions_info = [
-        {
-            "filename": version_path.split("/")[-1],
-            "filepath": version_path,
-            "thumbnail_url": get_image_url(dbx, f"/{game}/{asset}/{version_path}"),
-        }
-        for version_path in versions_paths
+        {**version, "thumbnail_url": thumbnail_urls.get(f"/{game}/{asset}/{version['filename']}")}
+        for version in versions
     ]
-    versions_info.reverse()  # Reverse to show newest first
-    return versions_info
+    return versions_info, has_more
+
+
+def get_thumbnail_urls(dbx, files):
+    """URLs of small renditions for files, a dict of Dropbox path to content hash.
+
+    Thumbnails missing from the local store are fetched in batches first. Files
+    Dropbox cannot render fall back to temporary links to the originals.
+    """
+    available = thumbnail_store.fetch(dbx, files)
+    urls = {
+        path: url_for("thumbnail", path=path, v=content_hash)
+        for path, content_hash in available.items()
+    }
+    fallback = [path for path in files if path not in urls]
+    urls.update(get_image_urls(dbx, fallback))
+    return urls
+
+
+def get_thumbnail(dbx, path, content_hash=None):
+    """Returns (thumbnail bytes, content hash) for path, or (None, None)."""
+    data = thumbnail_store.get(path, content_hash)
+    if data is not None:
+        return data, content_hash
+    content_hash = thumbnail_store.fetch(dbx, {path: content_hash}).get(path)
+    if content_hash is None:
+        return None, None
+    return thumbnail_store.get(path, content_hash), content_hash
+
+
+def get_image_urls(dbx, file_paths):
+    """Resolves temporary links for many files at once on a bounded worker pool.
+
+    Links that fail or are still pending when the timeout runs out map to None.
+    """
+    if not file_paths:
+        return {}
+
+    max_workers = min(current_app.config["THUMBNAIL_LINK_WORKERS"], len(file_paths))
+    # Each worker handles its share of links one after another, so allow one
+    # link timeout per round of work.
+    rounds = -(-len(file_paths) // max_workers)
+    deadline = time.monotonic() + current_app.config["THUMBNAIL_LINK_TIMEOUT"] * rounds
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            file_path: executor.submit(get_image_url, dbx, file_path)
+            for file_path in file_paths
+        }
+        urls = {}
+        for file_path, future in futures.items():
+            try:
+                urls[file_path] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                logger.warning(f"Timed out getting temporary link for {file_path}")
+                urls[file_path] = None
+            except Exception as e:
+                logger.error(f"Failed to get temporary link for {file_path}: {e}")
+                urls[file_path] = None
+        return urls
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 def get_image_url(dbx, file_path):
 
     full_path = f"/{file_path.lstrip('/')}"  # Ensure the path starts with '/'
+    cached_link = temporary_link_cache.get(full_path.lower())
+    if cached_link:
+        return cached_link
     try:
         temp_link = dbx.files_get_temporary_link(full_path)
+        temporary_link_cache.set(full_path.lower(), temp_link.link)
         return temp_link.link
     except dropbox.exceptions.ApiError as err:
         print(f"API error: {err}")
@@ -60,21 +211,28 @@ def get_image_url(dbx, file_path):
 
 
 def get_supabase():
-    url = current_app.config["SUPABASE_URL"]
-    key = current_app.config["SUPABASE_KEY"]
-    return create_client(url, key)
+    """Returns the worker's shared Supabase client for table queries."""
+    return get_shared_client(current_app.config)
+
+
+def get_auth_supabase():
+    """Returns an isolated Supabase client for flows that sign a user in."""
+    return create_auth_client(current_app.config)
 
 
 def register_user(email, password):
-    supabase = get_supabase()
+    supabase = get_auth_supabase()
     user, error = supabase.auth.sign_up(email=email, password=password)
     if error:
         return None, str(error)
     return user, None
 
 
-def log_activity(status, supabase, user_email, action_type, asset_name, path):
-    """Logs user activity to the Supabase table."""
+def log_activity(status, supabase, user_email, action_type, asset_name, path, wait=False):
+    """Queues user activity for the Supabase table without waiting for the insert.
+
+    With wait, blocks until the row is written and returns whether it was.
+    """
     record = {
         "status": status,
         "user_email": user_email,
@@ -82,21 +240,19 @@ def log_activity(status, supabase, user_email, action_type, asset_name, path):
         "asset_name": asset_name,
         "path": path,
     }
-    try:
-        response = supabase.table("activity_log").insert(record).execute()
-        return response
-    except Exception as e:
-        flash(f"Error logging activity: {e}")
+    return activity_recorder.record(supabase, record, wait=wait)
 
 
 def add_comment_to_activity(activity_id, user_email, comment):
     supabase = get_supabase()
     record = {"activity_log_id": activity_id, "author": user_email, "comment": comment}
     try:
+        # Failed inserts raise APIError; the response carries the stored row
         response = supabase.table("comments").insert(record).execute()
-        if response.error:
-            raise Exception(response.error.message)
-        return {"status": "success"}
+        comment = response.data[0]
+        comment_cache.update(str(activity_id), lambda comments: [comment] + comments)
+        publish_events("comment", [comment])
+        return {"status": "success", "comment": comment}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -121,9 +277,8 @@ def add_assignment_to_database(
         "completed": completed,
     }
     try:
-        response = supabase.table("assignments").insert(record).execute()
-        if response.error:
-            raise Exception(response.error.message)
+        # Failed inserts raise APIError
+        supabase.table("assignments").insert(record).execute()
         return {"status": "success", "message": "Assignment added successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -150,42 +305,155 @@ def list_users():
     return data
 
 
-def get_activity_log(supabase):
-    """Fetches the activity log from Supabase."""
+# Only the columns the dashboard renders
+ACTIVITY_COLUMNS = "id,status,user_email,action_type,asset_name,created_at,path"
+
+
+def get_activity_page(supabase, status, cursor=None, limit=None):
+    """Fetches one page of activity log entries with a status, newest first.
+
+    Returns (entries, cursor for the next page or None).
+    """
     try:
-        response = (
-            supabase.table("activity_log")
-            .select("*")
-            .order("created_at", desc=True)
-            .execute()
+        query = supabase.table("activity_log").select(ACTIVITY_COLUMNS).eq("status", status)
+        return keyset_page(
+            query,
+            "created_at",
+            cursor,
+            limit or current_app.config["DASHBOARD_PAGE_SIZE"],
         )
-        return response.data
     except Exception as e:
         flash(f"Error fetching activity log: {e}")
-        return None
+        return [], None
 
 
-def get_assignments(supabase):
-    """Fetches the assignments from Supabase."""
+def get_activity_counts(supabase, statuses):
+    """Counts activity log entries per status without fetching them."""
+    counts = {}
+    for status in statuses:
+        try:
+            # A column-less select would be a HEAD request, but this postgrest
+            # version reports no count for those, so fetch a single id instead
+            response = (
+                supabase.table("activity_log")
+                .select("id", count="exact")
+                .eq("status", status)
+                .limit(1)
+                .execute()
+            )
+            counts[status] = response.count
+        except Exception as e:
+            logger.error(f"Error counting {status} activity: {e}")
+            counts[status] = None
+    return counts
+
+
+def get_newest_activity_id(supabase):
+    """Id of the most recent activity log entry, None if it cannot be read."""
     try:
         response = (
-            supabase.table("assignments")
-            .select("*")
-            .order("to_be_completed_by", desc=False)
-            .execute()
+            supabase.table("activity_log").select("id").order("id", desc=True).limit(1).execute()
+        )
+    except Exception as e:
+        logger.error(f"Error reading the newest activity: {e}")
+        return None
+    return response.data[0]["id"] if response.data else 0
+
+
+def comments_validator(comments):
+    """Comments are only ever added, so their ids and times identify a list of them."""
+    return [(comment["id"], comment.get("created_at")) for comment in comments]
+
+
+# Only the columns the assignments page renders
+ASSIGNMENT_COLUMNS = (
+    "id,assigned_to,assigned_by,asset_path,upload_path,details,to_be_completed_by,completed"
+)
+
+
+def parse_assignment_filters(args):
+    """Reads assignment filters from query arguments.
+
+    status is "open" (the default), "completed" or "all"; mine limits the list
+    to the current user; due_from and due_to bound the due date (YYYY-MM-DD).
+    """
+    status = args.get("status", "open")
+    if status not in ("open", "completed", "all"):
+        status = "open"
+    return {
+        "status": status,
+        "mine": args.get("mine") in ("1", "true", "on"),
+        "due_from": args.get("due_from") or None,
+        "due_to": args.get("due_to") or None,
+    }
+
+
+def get_assignments_page(supabase, filters, cursor=None, limit=None):
+    """Fetches one page of assignments matching filters, soonest due first.
+
+    Returns (assignments, cursor for the next page or None).
+    """
+    try:
+        query = _filter_assignments(
+            supabase.table("assignments").select(ASSIGNMENT_COLUMNS), filters
+        )
+        if filters["status"] != "all":
+            query = query.eq("completed", filters["status"] == "completed")
+        return keyset_page(
+            query,
+            "to_be_completed_by",
+            cursor,
+            limit or current_app.config["DASHBOARD_PAGE_SIZE"],
+            desc=False,
         )
-        return response.data
     except Exception as e:
         flash(f"Error fetching assignments: {e}")
+        return [], None
+
+
+def get_assignments_validator(supabase, filters):
+    """Count and newest id of the assignments matching filters, per completion state.
+
+    Assignments are only ever added or completed, which changes one of these, so
+    they decide whether a list of them is still current. None if they cannot
+    be read.
+    """
+    states = [filters["status"] == "completed"] if filters["status"] != "all" else [False, True]
+    validator = [current_user.email, filters]
+    try:
+        for completed in states:
+            response = (
+                _filter_assignments(
+                    supabase.table("assignments").select("id", count="exact"), filters
+                )
+                .eq("completed", completed)
+                .order("id", desc=True)
+                .limit(1)
+                .execute()
+            )
+            validator.append([response.count, response.data[0]["id"] if response.data else 0])
+    except Exception as e:
+        logger.error(f"Error reading assignment counts: {e}")
         return None
+    return validator
+
+
+def _filter_assignments(query, filters):
+    if filters["mine"]:
+        query = query.eq("assigned_to", current_user.email)
+    if filters["due_from"]:
+        query = query.gte("to_be_completed_by", filters["due_from"])
+    if filters["due_to"]:
+        query = query.lte("to_be_completed_by", filters["due_to"])
+    return query
 
 
 def get_assignment_by_id(supabase, assignment_id):
-    """Fetches a specific assignment by ID from Supabase."""
+    """Fetches the fields submit_assignment checks for one assignment."""
     try:
         response = (
             supabase.table("assignments")
-            .select("*")
+            .select("id,completed")
             .eq("id", assignment_id)
             .single()
             .execute()
@@ -206,6 +474,7 @@ def update_dashboard_status(supabase, id):
             .eq("id", id)
             .execute()
         )
+        publish_events("status", response.data)
 
         print("Entry status updated successfully.")
     except Exception as e:
@@ -229,148 +498,64 @@ def update_assignment_status(supabase, assignment_id, completed):
 
 
 def get_comments_by_activity_id(supabase, activity_id):
-    """Fetches comments for a specific activity log entry from Supabase."""
+    """Fetches comments for a specific activity log entry, newest first."""
+    comments = get_comments_for_activities(supabase, [activity_id])
+    return comments.get(str(activity_id)) if comments is not None else None
+
+
+def get_comments_for_activities(supabase, activity_ids):
+    """Returns comments grouped by activity id, newest first.
+
+    Cached activities are served from memory; all the others are fetched
+    together with a single in_ query.
+    """
+    grouped = {}
+    missing = []
+    for activity_id in dict.fromkeys(str(a) for a in activity_ids):
+        comments = comment_cache.get(activity_id)
+        if comments is None:
+            missing.append(activity_id)
+        else:
+            grouped[activity_id] = comments
+    if not missing:
+        return grouped
+
     try:
         response = (
             supabase.table("comments")
             .select("*")
-            .eq("activity_log_id", activity_id)
+            .in_("activity_log_id", missing)
             .order("created_at", desc=True)
             .execute()
         )
-        return response.data
     except Exception as e:
         flash(f"Error fetching comments: {e}")
         return None
 
+    fetched = {activity_id: [] for activity_id in missing}
+    for comment in response.data:
+        fetched[str(comment["activity_log_id"])].append(comment)
+    for activity_id, comments in fetched.items():
+        comment_cache.set(activity_id, comments)
+    grouped.update(fetched)
+    return grouped
 
-def dropbox_upload_file(
-    local_path, dropbox_path, chunk_size=100 * 1024 * 1024, max_retries=5, retry_delay=2
-):
-    dbx = dropbox_connect()
-    file_size = os.path.getsize(local_path)
 
-    with open(local_path, "rb") as f:
-        if file_size <= chunk_size:
-            return attempt_upload(dbx, f, dropbox_path, max_retries, retry_delay)
-        else:
-            return upload_large_file_in_chunks(
-                dbx, f, dropbox_path, file_size, chunk_size, max_retries, retry_delay
-            )
-
-
-def attempt_upload(dbx, file_handle, dropbox_path, max_retries, retry_delay):
-    for attempt in range(max_retries):
-        try:
-            dbx.files_upload(file_handle.read(), dropbox_path, mute=True)
-            logger.info(f"Successfully uploaded file to Dropbox: {dropbox_path}")
-            return True
-        except (ApiError, HttpError, requests.exceptions.ConnectionError) as err:
-            logger.error(
-                f"Attempt {attempt + 1} failed to upload {dropbox_path}: {err}"
-            )
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logger.error(
-                    f"Failed to upload {dropbox_path} after {max_retries} attempts."
-                )
-                return False
-
-
-def upload_large_file_in_chunks(
-    dbx, file_handle, dropbox_path, file_size, chunk_size, max_retries, retry_delay
-):
-    try:
-        if file_size <= chunk_size:
-            upload_session_start_result = dbx.files_upload_session_start(
-                file_handle.read()
-            )
-            cursor = dropbox.files.UploadSessionCursor(
-                session_id=upload_session_start_result.session_id,
-                offset=file_handle.tell(),
-            )
-            commit = dropbox.files.CommitInfo(path=dropbox_path)
-            dbx.files_upload_session_finish(file_handle.read(), cursor, commit)
-            return True
-        else:
-            upload_session_start_result = dbx.files_upload_session_start(
-                file_handle.read(chunk_size)
-            )
-            cursor = dropbox.files.UploadSessionCursor(
-                session_id=upload_session_start_result.session_id,
-                offset=file_handle.tell(),
-            )
-            commit = dropbox.files.CommitInfo(path=dropbox_path)
-
-            while file_handle.tell() < file_size:
-                if (file_size - file_handle.tell()) <= chunk_size:
-                    attempt_upload_session_finish(
-                        dbx,
-                        file_handle.read(chunk_size),
-                        cursor,
-                        commit,
-                        max_retries,
-                        retry_delay,
-                    )
-                else:
-                    attempt_upload_session_append(
-                        dbx,
-                        file_handle.read(chunk_size),
-                        cursor,
-                        max_retries,
-                        retry_delay,
-                    )
-                    cursor.offset = file_handle.tell()
-            return True
-    except Exception as err:
-        logger.error(f"Failed to start or continue upload session: {err}")
-        return False
-
-
-def attempt_upload_session_append(dbx, data, cursor, max_retries, retry_delay):
-    for attempt in range(max_retries):
-        try:
-            dbx.files_upload_session_append_v2(data, cursor)
-            return
-        except (ApiError, HttpError, requests.exceptions.ConnectionError) as err:
-            logger.error(f"Attempt {attempt + 1} failed during session append: {err}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logger.error(
-                    f"Failed to append to upload session after {max_retries} attempts."
-                )
-                raise
-
-
-def attempt_upload_session_finish(dbx, data, cursor, commit, max_retries, retry_delay):
-    for attempt in range(max_retries):
-        try:
-            dbx.files_upload_session_finish(data, cursor, commit)
-            return
-        except (ApiError, HttpError, requests.exceptions.ConnectionError) as err:
-            logger.error(f"Attempt {attempt + 1} failed during session finish: {err}")
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                logger.error(
-                    f"Failed to finish upload session after {max_retries} attempts."
-                )
-                raise
+def record_upload(dropbox_path, metadata=None):
+    """Brings the in-process caches up to date after a successful upload."""
+    # A re-upload replaces the file, so any link handed out for it is stale
+    temporary_link_cache.invalidate(dropbox_path.lower())
+    folder_cache.record_upload(dropbox_path, metadata)
+    folder_tree_cache.clear()
+    version_index.record_upload(dropbox_path, metadata)
+    if metadata is not None:
+        search_index.record_upload(metadata)
 
 
 def list_folders(dbx, path=""):
     try:
-        folders = dbx.files_list_folder(path).entries
-        folder_names = [
-            folder.name
-            for folder in folders
-            if isinstance(folder, dropbox.files.FolderMetadata)
-        ]
+        entries = folder_cache.list(dbx, path)
+        folder_names = [entry["name"] for entry in entries if entry["type"] == "folder"]
         return folder_names
     except Exception as e:
         logger.error(f"Failed to list folders: {e}")
@@ -393,193 +578,747 @@ def sanitize_filename(filename):
     return f"{name}{ext}"
 
 
-def process_and_upload_file(uploaded_file, selected_folder, folder_options, dbx):
-    print(f"Uploed file: {uploaded_file.filename}")
-    filename = secure_filename(uploaded_file.filename)
+def timestamped_filename(original_filename):
+    """Secure, de-duplicated filename stamped with the upload time."""
+    filename = secure_filename(original_filename)
     print(f"Secure filename: {filename}")
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = sanitize_filename(filename)
-    filename = f"{filename.rsplit('.', 1)[0]}_{timestamp}.{filename.rsplit('.', 1)[1]}"
-    temp_dir = create_temp_dir(current_app.root_path)
-    temp_file_path = os.path.join(temp_dir, filename)
+    return f"{filename.rsplit('.', 1)[0]}_{timestamp}.{filename.rsplit('.', 1)[1]}"
 
-    try:
-        uploaded_file.save(temp_file_path)  # Save the file to the temporary directory
-        logger.info(f"Saved file to temporary path: {temp_file_path}")
 
-        if selected_folder in folder_options:
-            dropbox_file_path = f"/{selected_folder}/{filename}"
-            success = upload_file_with_retries(temp_file_path, dropbox_file_path, dbx)
+def receive_upload(stream, dbx, job, hold=False):
+    """Reads an incoming stream into a new upload session writer tracked by job.
 
-            if success:
-                log_activity(
-                    "Action Needed",
-                    get_supabase(),
-                    current_user.email,
-                    "upload",
-                    filename,
-                    dropbox_file_path,
-                )
-            else:
-                flash("Error uploading file to Dropbox.", "error")
-                log_activity(
-                    "failure",
-                    get_supabase(),
-                    current_user.email,
-                    "upload",
-                    filename,
-                    dropbox_file_path,
-                )
-    finally:
-        os.remove(temp_file_path)  # Clean up the temporary file after upload
+    With hold, nothing is sent while receiving; see open_upload_writer.
+    """
+    chunk_size = current_app.config["UPLOAD_CHUNK_SIZE"]
+    writer = open_upload_writer(
+        dbx,
+        chunk_size=chunk_size,
+        spill_dir=create_temp_dir(current_app.root_path),
+        parallelism=current_app.config["UPLOAD_PARALLELISM"],
+        hold=hold,
+    )
+    job.track(writer)
+    try:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                return writer
+            writer.write(data)
+    except Exception:
+        writer.discard()
+        raise
+
+
+def commit_upload(writer, dropbox_path):
+    """Sends what is left of a received upload and commits it; returns its metadata or None."""
+    try:
+        metadata = writer.finish(dropbox_path)
+    except Exception as e:
+        logger.error(f"Failed to upload {dropbox_path}: {e}")
+        return None
+    logger.info(f"Successfully uploaded file to Dropbox: {dropbox_path}")
+    record_upload(dropbox_path, metadata)
+    return metadata
+
+
+def find_duplicate_version(dbx, dropbox_path, content_hash, size=None):
+    """Path of an existing version of the same asset with this content, or None.
+
+    With size, only a version of exactly that size matches.
+    """
+    folder, filename = dropbox_path.rsplit("/", 1)
+    asset = sanitize_filename(filename).lower()
+    for version in version_index.with_content_hash(dbx, folder, content_hash):
+        if sanitize_filename(version["filename"]).lower() != asset:
+            continue
+        if size is None or version["size"] == size:
+            return version["path_display"]
+    return None
+
+
+def has_earlier_version(dbx, dropbox_path):
+    """Whether the folder of dropbox_path already holds a version of the same asset."""
+    folder, filename = dropbox_path.rsplit("/", 1)
+    asset = sanitize_filename(filename).lower()
+    try:
+        return any(
+            entry["type"] == "file" and sanitize_filename(entry["name"]).lower() == asset
+            for entry in folder_cache.list(dbx, folder)
+        )
+    except Exception as e:
+        logger.warning(f"Could not look up earlier versions of {dropbox_path}: {e}")
+        return False
 
 
-def process_and_upload_folder(directory_files, selected_folder, folder_options, dbx):
-    temp_dir = create_temp_dir(current_app.root_path)
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+def deduplicate_upload(dbx, dropbox_path, content_hash, size=None):
+    """Applies DEDUP_MODE to an upload whose content may already exist.
 
-    original_folder_name = directory_files[0].filename.split("/")[0]
-    original_folder_name = sanitize_filename(original_folder_name)
+    Returns (existing path, metadata of the copy). The existing path is None when
+    the content is new, or copying failed, and the upload has to go ahead; the
+    metadata is None when the duplicate is skipped.
+    """
+    mode = current_app.config["DEDUP_MODE"]
+    if mode not in ("copy", "skip") or not content_hash:
+        return None, None
+    try:
+        source = find_duplicate_version(dbx, dropbox_path, content_hash, size)
+        if source is None or mode == "skip":
+            return source, None
+        metadata = call_with_retries(
+            lambda: dbx.files_copy_v2(source, dropbox_path).metadata,
+            f"copy of {source}",
+            max_retries=5,
+            retry_delay=2,
+        )
+    except Exception as e:
+        logger.error(f"Could not deduplicate {dropbox_path}, uploading it instead: {e}")
+        return None, None
+    logger.info(f"Copied {source} to {dropbox_path} instead of uploading identical content")
+    record_upload(dropbox_path, metadata)
+    return source, metadata
 
-    new_folder_name = f"{original_folder_name}_{timestamp}"
 
-    for directory_file in directory_files:
-        if directory_file.filename:
-            relative_path = directory_file.filename.replace(
-                original_folder_name, new_folder_name, 1
-            )
-            file_path = os.path.join(temp_dir, relative_path)
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            directory_file.save(file_path)
-
-    all_success = True
-    for root, _, files in os.walk(temp_dir):
-        for file in files:
-            local_file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(local_file_path, temp_dir)
-            dropbox_path = (
-                f"/{selected_folder}/{relative_path.replace(os.path.sep, '/')}"
-            )
-            success = upload_file_with_retries(local_file_path, dropbox_path, dbx)
-            if not success:
-                all_success = False
+def receive_file(uploaded_file, selected_folder, folder_options, dbx, job):
+    """Receives one uploaded file and returns the step that commits it in the job.
 
-    cleanup_temp_dir(temp_dir)
+    Returns None, with the file counted as failed, if selected_folder is not one
+    of folder_options.
+    """
+    print(f"Uploed file: {uploaded_file.filename}")
+    filename = timestamped_filename(uploaded_file.filename)
+    if selected_folder not in folder_options:
+        # Counted, so the job does not finish as done with files missing
+        logger.error(f"Rejected {filename}: unknown folder {selected_folder!r}")
+        job.files_failed += 1
+        return None
 
-    if all_success:
+    dropbox_file_path = f"/{selected_folder}/{filename}"
+    user_email = current_user.email
+    # The content hash is only known once the file has been read, so when an
+    # earlier version could turn out identical the file is held on local disk
+    # instead of being sent while it arrives. Files smaller than a chunk are
+    # never sent before commit anyway.
+    hold = current_app.config["DEDUP_MODE"] in ("copy", "skip") and has_earlier_version(
+        dbx, dropbox_file_path
+    )
+    try:
+        writer = receive_upload(uploaded_file.stream, dbx, job, hold=hold)
+    except Exception as e:
+        logger.error(f"Failed to receive {dropbox_file_path}: {e}")
+        writer = None
+
+    def commit():
+        duplicate_of, metadata = (
+            deduplicate_upload(dbx, dropbox_file_path, writer.content_hash)
+            if writer is not None
+            else (None, None)
+        )
+        if duplicate_of is not None:
+            writer.discard()
+            job.files_deduplicated += 1
+            if metadata is None:
+                # Skipped: the content is already there under the earlier name
+                job.files_done += 1
+                log_activity(
+                    "Duplicate",
+                    get_supabase(),
+                    user_email,
+                    "upload",
+                    filename,
+                    duplicate_of,
+                    wait=True,
+                )
+                return
+        elif writer is not None:
+            metadata = commit_upload(writer, dropbox_file_path)
+        if metadata is None:
+            job.files_failed += 1
+        else:
+            job.files_done += 1
         log_activity(
-            "Action Needed",
+            "Action Needed" if metadata is not None else "failure",
             get_supabase(),
-            current_user.email,
+            user_email,
             "upload",
-            new_folder_name,
-            f"/{selected_folder}/{new_folder_name}",
+            filename,
+            dropbox_file_path,
+            # Off the request path, so wait: a finished job has its dashboard entry
+            wait=True,
+        )
+
+    return commit
+
+
+class FolderUpload:
+    """Uploads the files of one browser folder upload as they arrive.
+
+    Files are sent on a bounded pool while later ones are still being received;
+    finish() commits them together in one batch and runs inside the transfer job.
+    Files whose content matches the previous upload of the same folder are not
+    sent again, but copied from it server-side or skipped, as DEDUP_MODE says.
+    """
+
+    def __init__(self, first_filename, selected_folder, dbx, job):
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        self.original_folder_name = sanitize_filename(first_filename.split("/")[0])
+        self.new_folder_name = f"{self.original_folder_name}_{timestamp}"
+        self.selected_folder = selected_folder
+        self.user_email = current_user.email
+        self.job = job
+        self.dbx = dbx
+        self._previous = None  # (path, files by relative path, paths by content hash)
+        dedup_mode = current_app.config["DEDUP_MODE"]
+        self.uploader = BatchFolderUploader(
+            dbx,
+            chunk_size=current_app.config["UPLOAD_CHUNK_SIZE"],
+            spill_dir=create_temp_dir(current_app.root_path),
+            workers=current_app.config["FOLDER_UPLOAD_WORKERS"],
+            find_duplicate=self._find_duplicate if dedup_mode in ("copy", "skip") else None,
+            copy_duplicates=dedup_mode == "copy",
+        )
+        job.track(self.uploader)
+
+    def add(self, directory_file):
+        if not directory_file.filename:
+            return
+        relative_path = directory_file.filename.replace(
+            self.original_folder_name, self.new_folder_name, 1
         )
-    else:
+        dropbox_path = f"/{self.selected_folder}/{relative_path}"
+        self.uploader.add(directory_file.stream, dropbox_path)
+
+    def finish(self):
+        uploaded, failed = self.uploader.finish()
+        for dropbox_path, metadata in uploaded.items():
+            record_upload(dropbox_path, metadata)
+        for dropbox_path in failed:
+            logger.error(f"Failed to upload {dropbox_path}")
+        duplicates = self.uploader.duplicates
+        skipped = 0 if self.uploader.copy_duplicates else len(duplicates)
+        if duplicates:
+            logger.info(
+                f"{len(duplicates)} files of {self.new_folder_name} were unchanged and "
+                f"{'skipped' if skipped else 'copied server-side'}"
+            )
+        self.job.files_done += len(uploaded) + skipped
+        self.job.files_failed += len(failed)
+        self.job.files_deduplicated += len(duplicates)
+
+        if skipped and not uploaded and not failed:
+            # Nothing changed, so no new folder was created
+            log_activity(
+                "Duplicate",
+                get_supabase(),
+                self.user_email,
+                "upload",
+                self.new_folder_name,
+                self._previous[0],
+                wait=True,
+            )
+            return
+
         log_activity(
-            "failure",
+            "failure" if failed else "Action Needed",
             get_supabase(),
-            current_user.email,
+            self.user_email,
             "upload",
-            new_folder_name,
-            f"/{selected_folder}/{new_folder_name}",
+            self.new_folder_name,
+            f"/{self.selected_folder}/{self.new_folder_name}",
+            wait=True,
         )
 
 
-def upload_file_with_retries(local_file_path, dropbox_path, dbx, retries=5):
-    for attempt in range(retries):
+    def _find_duplicate(self, dropbox_path, content_hash):
+        if self._previous is None:
+            self._previous = self._load_previous_upload()
+        _, by_path, by_hash = self._previous
+        new_folder = f"/{self.selected_folder}/{self.new_folder_name}".lower()
+        previous = by_path.get(dropbox_path.lower()[len(new_folder) + 1 :])
+        if previous is not None and previous.content_hash == content_hash:
+            return previous.path_display
+        # Moved or renamed files can still be copied
+        return by_hash.get(content_hash)
+
+    def _load_previous_upload(self):
         try:
-            success = dropbox_upload_file(local_file_path, dropbox_path)
-            if success:
-                flash(f"Successfully uploaded file to Dropbox: {dropbox_path}")
-                return True
+            folders = [
+                entry
+                for entry in folder_cache.list(self.dbx, f"/{self.selected_folder}")
+                if entry["type"] == "folder"
+                and entry["name"] != self.new_folder_name
+                and sanitize_filename(entry["name"]) == self.original_folder_name
+            ]
+            if not folders:
+                return None, {}, {}
+            latest = max(
+                folders,
+                key=lambda entry: (parse_version_time(entry["name"]) or datetime.min, entry["name"]),
+            )
+            files = list_files_recursive(self.dbx, latest["path_lower"])
         except Exception as e:
-            flash(f"Attempt {attempt + 1} failed to upload {dropbox_path}: {e}")
-            if attempt < retries - 1:
-                flash(
-                    f"Retrying upload for {dropbox_path} (attempt {attempt + 2}/{retries})"
-                )
-                time.sleep(2**attempt)  # Exponential backoff
-    return False
+            logger.error(f"Could not list the previous upload of {self.original_folder_name}: {e}")
+            return None, {}, {}
+        start = len(latest["path_lower"]) + 1
+        by_path = {metadata.path_lower[start:]: metadata for metadata in files}
+        by_hash = {metadata.content_hash: metadata.path_display for metadata in files}
+        return latest["path_display"], by_path, by_hash
+
+
+def request_parts():
+    """Iterates over the parts of the current multipart request as they arrive."""
+    boundary = request.mimetype_params["boundary"].encode()
+    return MultipartStream(request.stream, boundary).parts()
+
+
+def stream_upload_request(folder_options, dbx):
+    """Receives the files of the current multipart request into upload sessions.
+
+    Data goes on to Dropbox while the request is still arriving. Committing the
+    files, retries and activity logging are left to a background transfer job.
+    The destination folder field has to come before the files, as it does in
+    the upload form. Returns (files received, job); files received is None if
+    the folder was missing when the first file arrived.
+    """
+    selected_folder = None
+    folder_upload = None
+    job = None
+    steps = []
+
+    try:
+        for part in request_parts():
+            if part.name == "folder" and part.filename is None:
+                selected_folder = part.value
+            elif part.filename and part.name in ("file", "directory"):
+                if selected_folder is None:
+                    return None, None
+                if job is None:
+                    job = transfer_jobs.create("upload", current_user.email, selected_folder)
+                job.files_total += 1
+                if part.name == "file":
+                    step = receive_file(part, selected_folder, folder_options, dbx, job)
+                    if step is not None:
+                        steps.append(step)
+                else:
+                    if folder_upload is None:
+                        folder_upload = FolderUpload(part.filename, selected_folder, dbx, job)
+                        steps.append(folder_upload.finish)
+                    folder_upload.add(part)
+    except Exception as e:
+        if job is not None:
+            transfer_jobs.fail(job, e)
+        raise
+
+    if job is None:
+        return 0, None
+
+    def work(job):
+        for step in steps:
+            step()
+
+    transfer_jobs.submit(current_app._get_current_object(), job, work)
+    return job.files_total, job
+
+
+def submit_assignment_upload(assignment_id, stream, dropbox_path, dbx):
+    """Receives an assignment submission and marks it complete from a transfer job."""
+    job = transfer_jobs.create("assignment", current_user.email, dropbox_path)
+    job.files_total = 1
+    try:
+        writer = receive_upload(stream, dbx, job)
+    except Exception as e:
+        logger.error(f"Failed to receive {dropbox_path}: {e}")
+        writer = None
+
+    def work(job):
+        metadata = commit_upload(writer, dropbox_path) if writer is not None else None
+        if metadata is None:
+            job.files_failed += 1
+            return
+        job.files_done += 1
+        update_assignment_status(get_supabase(), assignment_id, True)
+
+    transfer_jobs.submit(current_app._get_current_object(), job, work)
+    return job
 
 
-def cleanup_temp_dir(temp_dir):
-    for root, dirs, files in os.walk(temp_dir, topdown=False):
-        for name in files:
-            os.remove(os.path.join(root, name))
-        for name in dirs:
-            os.rmdir(os.path.join(root, name))
-    os.rmdir(temp_dir)
+def get_transfer_job(job_id):
+    return transfer_jobs.get(job_id)
+
+
+def resumable_upload_store():
+    return ResumableUploadStore(os.path.join(current_app.root_path, "temp", "resumable"))
+
+
+def resumable_upload_status(upload):
+    return {
+        "upload_id": upload["id"],
+        "offset": upload["offset"],
+        "size": upload["size"],
+        "chunk_size": current_app.config["UPLOAD_CHUNK_SIZE"],
+        "complete": upload["offset"] == upload["size"],
+    }
+
+
+def deduplicate_resumable_upload(original_filename, selected_folder, content_hash, size, dbx):
+    """Settles a resumable upload whose content the client says already exists.
+
+    The client's content_hash is not checked against any data; it only matches an
+    existing version of the same asset, in the same folder, of the same size.
+    Returns {"duplicate_of", "path"}, with path None if the upload was skipped, or
+    None when the file has to be uploaded after all.
+    """
+    filename = timestamped_filename(original_filename)
+    dropbox_path = f"/{selected_folder}/{filename}"
+    duplicate_of, metadata = deduplicate_upload(dbx, dropbox_path, content_hash, size)
+    if duplicate_of is None:
+        return None
+    log_activity(
+        "Action Needed" if metadata is not None else "Duplicate",
+        get_supabase(),
+        current_user.email,
+        "upload",
+        filename,
+        dropbox_path if metadata is not None else duplicate_of,
+    )
+    return {"duplicate_of": duplicate_of, "path": dropbox_path if metadata is not None else None}
+
+
+def start_resumable_upload(original_filename, selected_folder, size, dbx):
+    """Opens a Dropbox upload session that the client fills chunk by chunk."""
+    filename = timestamped_filename(original_filename)
+    session = dbx.files_upload_session_start(b"")
+    return resumable_upload_store().create(
+        session_id=session.session_id,
+        size=size,
+        filename=filename,
+        dropbox_path=f"/{selected_folder}/{filename}",
+        user_email=current_user.email,
+    )
+
+
+def append_resumable_chunk(upload, data, dbx):
+    """Appends data at the upload's acknowledged offset and saves the new offset."""
+    cursor = dropbox.files.UploadSessionCursor(
+        session_id=upload["session_id"], offset=upload["offset"]
+    )
+    try:
+        dbx.files_upload_session_append_v2(data, cursor)
+        upload["offset"] += len(data)
+    except ApiError as err:
+        # Dropbox already holds more (or less) than we recorded; trust its offset
+        error = err.error
+        if not (
+            isinstance(error, dropbox.files.UploadSessionLookupError)
+            and error.is_incorrect_offset()
+        ):
+            raise
+        upload["offset"] = error.get_incorrect_offset().correct_offset
+    resumable_upload_store().save(upload)
+    return upload
+
+
+def finish_resumable_upload(upload, dbx):
+    """Commits a fully received resumable upload and logs it."""
+    cursor = dropbox.files.UploadSessionCursor(
+        session_id=upload["session_id"], offset=upload["offset"]
+    )
+    commit = dropbox.files.CommitInfo(path=upload["dropbox_path"], mute=True)
+    metadata = dbx.files_upload_session_finish(b"", cursor, commit)
+    record_upload(upload["dropbox_path"], metadata)
+    log_activity(
+        "Action Needed",
+        get_supabase(),
+        upload["user_email"],
+        "upload",
+        upload["filename"],
+        upload["dropbox_path"],
+    )
+    resumable_upload_store().delete(upload["id"])
+    return metadata
 
 
 def list_files(dbx, path):
     """List all files within the specified path."""
 
     try:
-        files = dbx.files_list_folder(path).entries
-        file_names = [
-            file.name for file in files if isinstance(file, dropbox.files.FileMetadata)
-        ]
+        entries = folder_cache.list(dbx, path)
+        file_names = [entry["name"] for entry in entries if entry["type"] == "file"]
         return file_names
     except Exception as e:
 
         return []
 
 
-def download_file(dbx, path):
+def download_file(dbx, path, metadata=None):
+    """Streams a file from Dropbox to the client in chunks, honouring Range and If-Range."""
     try:
-        _, res = dbx.files_download(path)
-        if res.status_code == 200:
-            return send_file(
-                BytesIO(res.content),
-                as_attachment=True,
-                download_name=os.path.basename(path),
-                mimetype=None,
-            )
-        else:
-            print(f"Failed to download file with status code: {res.status_code}")
+        if metadata is None:
+            metadata = dbx.files_get_metadata(path)
+        etag = metadata.content_hash
+        size = metadata.size
+
+        byte_range = None
+        requested_range = request.range
+        if (
+            requested_range
+            and len(requested_range.ranges) == 1  # Multipart ranges are served whole
+            and if_range_matches(request.if_range, etag, metadata.server_modified)
+        ):
+            byte_range = requested_range.range_for_length(size)
+            if byte_range is None:
+                return Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+
+        upstream_headers = {}
+        if byte_range:
+            upstream_headers["Range"] = f"bytes={byte_range[0]}-{byte_range[1] - 1}"
+        link = dbx.files_get_temporary_link(path).link
+        upstream = get_http_session(current_app.config).get(
+            link, headers=upstream_headers, stream=True, timeout=100
+        )
+        if upstream.status_code not in (200, 206):
+            print(f"Failed to download file with status code: {upstream.status_code}")
+            upstream.close()
             return "File not found", 404
+
+        def generate():
+            try:
+                for chunk in upstream.iter_content(
+                    chunk_size=current_app.config["DOWNLOAD_CHUNK_SIZE"]
+                ):
+                    yield chunk
+            finally:
+                upstream.close()
+
+        response = Response(
+            stream_with_context(generate()),
+            status=upstream.status_code,
+            mimetype=mimetypes.guess_type(metadata.name)[0] or "application/octet-stream",
+            direct_passthrough=True,
+        )
+        response.headers["Accept-Ranges"] = "bytes"
+        response.headers["ETag"] = f'"{etag}"'
+        response.last_modified = metadata.server_modified.replace(tzinfo=timezone.utc)
+        response.headers["Content-Length"] = upstream.headers.get(
+            "Content-Length", str(size)
+        )
+        if upstream.status_code == 206:
+            response.headers["Content-Range"] = upstream.headers.get(
+                "Content-Range", f"bytes {byte_range[0]}-{byte_range[1] - 1}/{size}"
+            )
+        response.headers.set("Content-Disposition", "attachment", filename=metadata.name)
+        return response
     except Exception as e:
         print(f"Error downloading file: {e}")
         return "Error downloading file", 500
 
 
+def if_range_matches(if_range, etag, last_modified):
+    """Whether a Range request still applies, per its If-Range validator."""
+    if if_range is None or (if_range.etag is None and if_range.date is None):
+        return True
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    # A date only validates when it is exactly the Last-Modified we sent (RFC 9110)
+    return last_modified.replace(tzinfo=timezone.utc, microsecond=0) == if_range.date
+
+
 def download_folder_as_zip(dbx, path, folder_name):
+    """Streams a folder as a ZIP, building it locally when Dropbox refuses to zip it."""
+    config = current_app.config
     try:
-        _, res = dbx.files_download_zip(path)
+        try:
+            _, res = dbx.files_download_zip(path)
+        except ApiError as e:
+            if isinstance(e.error, dropbox.files.DownloadZipError) and (
+                e.error.is_too_large() or e.error.is_too_many_files()
+            ):
+                logger.info(f"Folder {path} is over the Dropbox zip limit, building ZIP64 stream")
+                files = list_files_recursive(dbx, path)
+                body = stream_folder_zip(
+                    dbx,
+                    files,
+                    path,
+                    folder_name,
+                    parallelism=config["ZIP_STREAM_PARALLELISM"],
+                    memory_budget=config["ZIP_STREAM_MEMORY_BUDGET"],
+                    chunk_size=config["DOWNLOAD_CHUNK_SIZE"],
+                )
+                return zip_response(body, folder_name)
+            raise
+
         if res.status_code == 200:
-            zip_buffer = BytesIO(res.content)
-            zip_buffer.seek(0)
-            return send_file(
-                zip_buffer,
-                as_attachment=True,
-                download_name=f"{folder_name}",
-                mimetype="application/zip",
-            )
+
+            def relay():
+                try:
+                    for chunk in res.iter_content(chunk_size=config["DOWNLOAD_CHUNK_SIZE"]):
+                        yield chunk
+                finally:
+                    res.close()
+
+            return zip_response(relay(), folder_name, res.headers.get("Content-Length"))
         else:
             print(f"Failed to download folder with status code: {res.status_code}")
+            res.close()
             return "Folder not found", 404
     except Exception as e:
         print(f"Error downloading folder: {e}")
         return "Error downloading folder", 500
 
 
+def zip_response(body, folder_name, content_length=None):
+    response = Response(
+        stream_with_context(body), mimetype="application/zip", direct_passthrough=True
+    )
+    if content_length:
+        response.headers["Content-Length"] = content_length
+    response.headers.set("Content-Disposition", "attachment", filename=folder_name)
+    return response
+
+
+def get_folder_validator(dbx, path):
+    """Names and revs of everything directly inside path, or None if it cannot be listed.
+
+    Served from the folder cache, which follows the folder's Dropbox cursor.
+    """
+    try:
+        return sorted(
+            (entry["path_display"], entry.get("rev")) for entry in folder_cache.list(dbx, path)
+        )
+    except Exception as e:
+        logger.error(f"Failed to list {path}: {e}")
+        return None
+
+
 def list_folders_files(dbx, path):
     try:
-        response = dbx.files_list_folder(path)
         items = [
             {
-                "name": entry.name,
-                "path_lower": entry.path_lower,
-                "type": (
-                    "folder"
-                    if isinstance(entry, dropbox.files.FolderMetadata)
-                    else "file"
-                ),
+                "name": entry["name"],
+                "path_lower": entry["path_lower"],
+                "type": entry["type"],
             }
-            for entry in response.entries
+            for entry in folder_cache.list(dbx, path)
         ]
         return items
     except dropbox.exceptions.ApiError as err:
         print(f"API Error: {err}")
         return []
+
+
+def get_folder_tree(dbx, path, max_depth, max_entries):
+    """Lists the subtree below path with one recursive listing.
+
+    Returns {"path", "complete", "children"}, where each node has name,
+    path_lower and type, and folders carry "children" only when their contents
+    were listed. Folders deeper than max_depth are left unlisted. If the subtree
+    has more than max_entries entries the listing stops there and complete is
+    False, since any folder may then be missing children.
+    """
+    base = normalize_path(path)
+    cache_key = (base, max_depth, max_entries)
+    tree = folder_tree_cache.get(cache_key)
+    if tree is not None:
+        return tree
+
+    entries = []
+    complete = True
+    result = dbx.files_list_folder(base, recursive=True)
+    while True:
+        entries.extend(e for e in result.entries if e.path_lower != base)
+        if not result.has_more:
+            break
+        if len(entries) >= max_entries:
+            complete = False
+            break
+        result = dbx.files_list_folder_continue(result.cursor)
+
+    root = {"children": []}
+    nodes = {base: root}
+    # Parents before children, whatever order the pages came in
+    for entry in sorted(entries, key=lambda e: e.path_lower.count("/")):
+        depth = entry.path_lower.count("/") - base.count("/")
+        parent = nodes.get(entry.path_lower.rsplit("/", 1)[0])
+        if depth > max_depth or parent is None or "children" not in parent:
+            continue
+        node = {"name": entry.name, "path_lower": entry.path_lower}
+        if isinstance(entry, dropbox.files.FolderMetadata):
+            node["type"] = "folder"
+            if depth < max_depth:
+                node["children"] = []
+            nodes[entry.path_lower] = node
+        else:
+            node["type"] = "file"
+        parent["children"].append(node)
+
+    tree = {"path": base, "complete": complete, "children": root["children"]}
+    folder_tree_cache.set(cache_key, tree)
+    return tree
+
+
+def parse_search_time(value):
+    """Parses an ISO date or datetime into naive UTC, as Dropbox reports times; None if invalid."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def search_assets(dbx, args):
+    """Answers a search from the in-memory index using the given query arguments."""
+    return search_index.search(
+        dbx,
+        query=args.get("q", ""),
+        mode="prefix" if args.get("mode") == "prefix" else "substring",
+        game=args.get("game") or None,
+        extension=args.get("ext") or None,
+        entry_type=args.get("type") if args.get("type") in ("file", "folder") else None,
+        modified_after=parse_search_time(args.get("modified_after")),
+        modified_before=parse_search_time(args.get("modified_before")),
+        limit=min(args.get("limit", 50, type=int), 500),
+    )
+
+
+def get_asset_versions(dbx, args):
+    """Answers a version query for args["game"]/args["asset"] from the version index.
+
+    ?latest returns the newest version, ?since=<ISO time> the versions uploaded
+    after it, and otherwise a page of the history from ?offset.
+    """
+    folder = f"/{args.get('game', '')}/{args.get('asset', '')}"
+    if "latest" in args:
+        return {"latest": version_index.latest(dbx, folder)}
+    if args.get("since"):
+        since = parse_search_time(args.get("since"))
+        if since is None:
+            return None
+        return {"versions": version_index.since(dbx, folder, since)}
+    offset = max(args.get("offset", 0, type=int), 0)
+    limit = min(args.get("limit", Config.VERSION_PAGE_SIZE, type=int), 500)
+    versions, has_more = version_index.history(dbx, folder, offset, limit)
+    return {
+        "versions": versions,
+        "next_offset": offset + len(versions) if has_more else None,
+    }
+
+
+def get_cache_stats():
+    """Hit/miss statistics for the in-process caches."""
+    return {
+        "temporary_links": temporary_link_cache.stats(),
+        "folders": folder_cache.stats(),
+        "folder_trees": folder_tree_cache.stats(),
+        "search_index": search_index.stats(),
+        "thumbnails": thumbnail_store.stats(),
+        "versions": version_index.stats(),
+        "comments": comment_cache.stats(),
+        "activity_writes": activity_recorder.stats(),
+        "event_streams": event_broker.stats(),
+    }
@@ -1,3 +1,199 @@
+// Comments per activity id, loaded for the whole page in one request
+const commentsByActivity = {};
+
+function updateCommentCount(activityId) {
+    const count = (commentsByActivity[activityId] || []).length;
+    document.querySelectorAll(`.preview-btn[data-activity-id="${activityId}"]`).forEach(button => {
+      button.textContent = count ? `Preview (${count} comments)` : "Preview";
+    });
+  }
+
+  async function loadCommentCounts() {
+    const ids = [...new Set(
+      [...document.querySelectorAll(".preview-btn[data-activity-id]")].map(button => button.dataset.activityId)
+    )];
+    if (ids.length === 0) {
+      return;
+    }
+    try {
+      const response = await fetch(`/get_comments?ids=${ids.map(encodeURIComponent).join(",")}`);
+      if (!response.ok) {
+        return;
+      }
+      Object.assign(commentsByActivity, await response.json());
+      ids.forEach(updateCommentCount);
+    } catch (error) {
+      console.error("Error fetching comments:", error);
+    }
+  }
+
+  document.addEventListener("DOMContentLoaded", loadCommentCounts);
+
+// Live updates: the server streams new entries, status changes and comments,
+// and the tables are patched in place. Local and realtime sources may both
+// report a change, so each one is applied once.
+const appliedEvents = new Set();
+
+function firstTime(key) {
+    if (appliedEvents.has(key)) {
+      return false;
+    }
+    appliedEvents.add(key);
+    return true;
+  }
+
+  function adjustCount(id, delta) {
+    const element = document.getElementById(id);
+    if (element) {
+      element.textContent = Number(element.textContent) + delta;
+    }
+  }
+
+  function findActivityRow(activityId) {
+    return document.querySelector(`tr[data-activity-row="${activityId}"]`);
+  }
+
+  function actionButton(className, label, onClick) {
+    const wrapper = document.createElement("div");
+    const button = document.createElement("button");
+    button.className = `btn ${className}`;
+    button.textContent = label;
+    button.addEventListener("click", onClick);
+    wrapper.appendChild(button);
+    return wrapper;
+  }
+
+  function linkButton(className, label, href) {
+    const wrapper = actionButton(className, "", () => {});
+    const link = document.createElement("a");
+    link.href = href;
+    link.textContent = label;
+    wrapper.firstChild.appendChild(link);
+    return wrapper;
+  }
+
+  // Same markup as the rows dashboard.html renders
+  function buildActivityRow(entry) {
+    const needsAction = entry.status === "Action Needed";
+    const row = document.createElement("tr");
+    row.dataset.activityRow = entry.id;
+    row.dataset.entry = JSON.stringify(entry);
+
+    const status = document.createElement("td");
+    status.className = needsAction ? "attention-needed" : entry.status === "Approved" ? "completed" : "";
+    status.textContent = entry.status;
+    row.appendChild(status);
+    [entry.user_email, entry.action_type, entry.asset_name, entry.created_at].forEach(value => {
+      const cell = document.createElement("td");
+      cell.textContent = value;
+      row.appendChild(cell);
+    });
+    const pathCell = document.createElement("td");
+    const download = document.createElement("a");
+    download.href = `/download_file_folder?path=${encodeURIComponent(entry.path)}`;
+    download.download = "";
+    download.textContent = entry.path;
+    pathCell.appendChild(download);
+    row.appendChild(pathCell);
+
+    const actions = document.createElement("td");
+    if (needsAction) {
+      actions.appendChild(linkButton("reassign-btn", "Re-assign", `/assignments/${encodeURI(entry.path)}`));
+    }
+    const preview = actionButton("preview-btn", "Preview", () => previewAsset(entry.path, String(entry.id)));
+    preview.firstChild.dataset.activityId = entry.id;
+    actions.appendChild(preview);
+    actions.appendChild(linkButton(
+      "view-dropbox-btn",
+      "View in Dropbox",
+      `https://www.dropbox.com/home/Apps/KingSizeGamesAssetManager/${entry.path}`
+    ));
+    if (needsAction) {
+      actions.appendChild(actionButton("approve-btn", "Approve Asset", () => approveAsset(entry.id)));
+    }
+    row.appendChild(actions);
+    return row;
+  }
+
+  // Keeps the table ordered newest first; entries older than the page are left to it
+  function insertActivityRow(body, entry) {
+    const rows = [...body.querySelectorAll("tr[data-activity-row]")];
+    const next = rows.find(row => JSON.parse(row.dataset.entry).created_at < entry.created_at);
+    if (next) {
+      body.insertBefore(buildActivityRow(entry), next);
+    } else if (rows.length === 0 || body.dataset.newest === "true") {
+      body.appendChild(buildActivityRow(entry));
+    }
+    updateCommentCount(String(entry.id));
+  }
+
+  function applyActivity(entry) {
+    if (entry.status !== "Action Needed" || !firstTime(`activity:${entry.id}`)) {
+      return;
+    }
+    adjustCount("attentionCount", 1);
+    const body = document.getElementById("attentionRows");
+    if (!body) {
+      location.reload();  // The table is only rendered once it has entries
+    } else if (body.dataset.newest === "true" && !findActivityRow(entry.id)) {
+      commentsByActivity[entry.id] = [];
+      body.prepend(buildActivityRow(entry));
+    }
+  }
+
+  function applyStatus(change) {
+    if (!firstTime(`status:${change.id}:${change.status}`)) {
+      return;
+    }
+    const row = findActivityRow(change.id);
+    const entry = { ...(row ? JSON.parse(row.dataset.entry) : {}), ...change };
+    if (row && row.closest("#attentionRows")) {
+      row.remove();
+      adjustCount("attentionCount", -1);
+    } else if (!row) {
+      adjustCount("attentionCount", -1);  // Approvals always come from Action Needed
+    }
+    if (change.status !== "Approved") {
+      return;
+    }
+    adjustCount("approvedCount", 1);
+    const body = document.getElementById("approvedRows");
+    if (!body) {
+      location.reload();
+    } else if (entry.path !== undefined && !body.querySelector(`tr[data-activity-row="${change.id}"]`)) {
+      insertActivityRow(body, entry);
+    }
+  }
+
+  function applyComment(comment) {
+    const activityId = String(comment.activity_log_id);
+    const known = commentsByActivity[activityId];
+    // Comment lists are loaded for every row on the page, so anything else is not shown
+    if (!known || known.some(existing => existing.id === comment.id)) {
+      return;
+    }
+    commentsByActivity[activityId] = [comment, ...known];
+    updateCommentCount(activityId);
+    const modal = document.getElementById("previewModal");
+    if (modal.style.display === "flex" && document.getElementById("new-comment").dataset.activityId === activityId) {
+      displayComments(commentsByActivity[activityId]);
+    }
+  }
+
+  function listenForChanges() {
+    if (!window.EventSource) {
+      return;
+    }
+    const events = new EventSource("/events");
+    events.addEventListener("activity", event => applyActivity(JSON.parse(event.data)));
+    events.addEventListener("status", event => applyStatus(JSON.parse(event.data)));
+    events.addEventListener("comment", event => applyComment(JSON.parse(event.data)));
+    // Sent when changes may have been missed; the reload is a cheap 304 if nothing changed
+    events.addEventListener("resync", () => location.reload());
+  }
+
+  document.addEventListener("DOMContentLoaded", listenForChanges);
+
 async function previewAsset(path, activityId) {
     try {
       const response = await fetch(`/preview_asset?path=${encodeURIComponent(path)}`);
@@ -6,8 +202,10 @@ async function previewAsset(path, activityId) {
   
       if (data.url) {
         imgPreview.src = data.url;
-        const comments = await fetchComments(activityId);
-        displayComments(comments);
+        if (!commentsByActivity[activityId]) {
+          commentsByActivity[activityId] = await fetchComments(activityId);
+        }
+        displayComments(commentsByActivity[activityId]);
         document.getElementById("new-comment").dataset.activityId = activityId; // Set the activityId as a data attribute on the textarea
         console.log(`Set activityId: ${activityId} on comment textarea`); // Debug log
         showModal("previewModal");
@@ -65,12 +263,15 @@ async function previewAsset(path, activityId) {
         body: JSON.stringify({ activity_log_id: activityId, comment: commentText }),
       });
   
-      if (response.ok) {
-        const comments = await fetchComments(activityId);
-        console.log(comments);  // Log fetched comments to ensure they are retrieved correctly
-        displayComments(comments);
+      const result = await response.json();
+      if (response.ok && result.status === "success") {
+        // The server returns the stored comment, so no need to fetch them all again
+        commentsByActivity[activityId] = [result.comment, ...(commentsByActivity[activityId] || [])];
+        displayComments(commentsByActivity[activityId]);
+        updateCommentCount(activityId);
+        document.getElementById("new-comment").value = "";
       } else {
-        console.error("Error adding comment:", await response.json());
+        console.error("Error adding comment:", result);
       }
     } catch (error) {
       console.error("Error adding comment:", error);
@@ -85,7 +286,10 @@ async function previewAsset(path, activityId) {
       });
       const data = await response.json();
       console.log(data);
-      location.reload();
+      if (response.ok) {
+        // The event stream reports the same change; whichever comes first is applied
+        applyStatus({ id: Number(id), status: "Approved" });
+      }
     } catch (error) {
       console.error('Error:', error);
     }
@@ -1,28 +1,149 @@
-document.getElementById('upload-form').onsubmit = async function(event) {
-    event.preventDefault();
+const MAX_CHUNK_RETRIES = 5;
 
-    const formData = new FormData();
-    const fileInput = document.getElementById('file');
-    const directoryInput = document.getElementById('directory');
+function delay(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+async function uploadStatus(uploadId) {
+    const response = await fetch(`/uploads/${uploadId}`);
+    return response.ok ? response.json() : null;
+}
 
-    if (fileInput.files.length > 0) {
-        formData.append('file', fileInput.files[0]);
+// Dropbox's content hash: SHA-256 over the SHA-256 digests of each 4 MiB block.
+// Browsers only offer SubtleCrypto on secure origins; without it the file is
+// simply uploaded.
+async function contentHash(file) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    const BLOCK_SIZE = 4 * 1024 * 1024;
+    const blockDigests = [];
+    for (let offset = 0; offset < file.size; offset += BLOCK_SIZE) {
+        const block = await file.slice(offset, offset + BLOCK_SIZE).arrayBuffer();
+        blockDigests.push(new Uint8Array(await crypto.subtle.digest('SHA-256', block)));
     }
+    const joined = new Uint8Array(blockDigests.length * 32);
+    blockDigests.forEach((digest, index) => joined.set(digest, index * 32));
+    const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', joined));
+    return Array.from(digest, byte => byte.toString(16).padStart(2, '0')).join('');
+}
 
-    for (const file of directoryInput.files) {
-        formData.append('directory', file);
+// Sends a file in chunks that the server acknowledges one by one, so a dropped
+// connection or a page reload resumes from the last acknowledged offset
+async function uploadResumable(file, folder) {
+    const resumeKey = `resumable-upload:${folder}/${file.name}:${file.size}:${file.lastModified}`;
+    const savedId = localStorage.getItem(resumeKey);
+    let status = savedId ? await uploadStatus(savedId) : null;
+
+    if (!status) {
+        const response = await fetch('/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                filename: file.name,
+                folder: folder,
+                size: file.size,
+                content_hash: await contentHash(file)
+            })
+        });
+        const result = await response.json();
+        if (!response.ok) {
+            throw new Error(result.message);
+        }
+        if (result.duplicate_of) {
+            return;  // Copied or skipped on the server; nothing to send
+        }
+        status = result;
+        localStorage.setItem(resumeKey, status.upload_id);
     }
 
-    const response = await fetch('/upload', {
-        method: 'POST',
-        body: formData
-    });
+    let failures = 0;
+    while (status.offset < file.size) {
+        const chunk = file.slice(status.offset, status.offset + status.chunk_size);
+        try {
+            const response = await fetch(`/uploads/${status.upload_id}?offset=${status.offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            });
+            // 409 means the server is at a different offset; its reply says where
+            if (!response.ok && response.status !== 409) {
+                throw new Error(`Chunk upload failed with status ${response.status}`);
+            }
+            status = await response.json();
+            failures = 0;
+        } catch (error) {
+            failures += 1;
+            if (failures > MAX_CHUNK_RETRIES) {
+                throw error;
+            }
+            await delay(1000 * 2 ** failures);
+            // The chunk may have arrived even though the reply did not
+            status = (await uploadStatus(status.upload_id)) || status;
+        }
+    }
 
+    const response = await fetch(`/uploads/${status.upload_id}/finish`, { method: 'POST' });
     const result = await response.json();
-    if (response.ok) {
+    if (!response.ok) {
+        throw new Error(result.message);
+    }
+    localStorage.removeItem(resumeKey);
+}
+
+// Folder uploads are committed by a background job once the request is done
+async function waitForJob(jobId) {
+    const progress = document.getElementById('upload-progress');
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.message);
+        }
+        progress.textContent = `${job.status}: ${job.files_done} of ${job.files_total} files, ` +
+            `${(job.bytes_sent / 1048576).toFixed(1)} MB sent, ${job.retries} retries`;
+        if (job.status === 'done') {
+            return;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || `${job.files_failed} files failed to upload`);
+        }
+        await delay(1000);
+    }
+}
+
+document.getElementById('upload-form').onsubmit = async function(event) {
+    event.preventDefault();
+
+    const folder = document.getElementById('folder').value;
+    const fileInput = document.getElementById('file');
+    const directoryInput = document.getElementById('directory');
+
+    try {
+        for (const file of fileInput.files) {
+            await uploadResumable(file, folder);
+        }
+
+        if (directoryInput.files.length > 0) {
+            const formData = new FormData();
+            // The server streams files straight to Dropbox, so it needs the folder first
+            formData.append('folder', folder);
+            for (const file of directoryInput.files) {
+                formData.append('directory', file);
+            }
+
+            const response = await fetch('/upload', {
+                method: 'POST',
+                body: formData
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.message);
+            }
+            await waitForJob(result.job_id);
+        }
         alert('Upload successful');
-    } else {
-        alert('Upload failed: ' + result.message);
+    } catch (error) {
+        alert('Upload failed: ' + error.message);
     }
 };
-
@@ -0,0 +1,70 @@
+# supabase_pool.py
+import os
+import threading
+
+import httpx
+from postgrest.utils import SyncClient
+from supabase import Client, ClientOptions
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class PooledClient(Client):
+    """Supabase client whose PostgREST transport keeps a sized pool of live connections."""
+
+    def __init__(self, supabase_url, supabase_key, options=None, limits=None):
+        self._limits = limits or httpx.Limits()
+        super().__init__(supabase_url, supabase_key, options)
+
+    def _init_postgrest_client(self, rest_url, headers, schema, timeout):
+        client = super()._init_postgrest_client(
+            rest_url=rest_url, headers=headers, schema=schema, timeout=timeout
+        )
+        default_session = client.session
+        client.session = SyncClient(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=default_session.timeout,
+            limits=self._limits,
+        )
+        default_session.close()
+        return client
+
+
+def _session_free_options():
+    # Never keep or refresh a user session on a client that other requests use
+    return ClientOptions(auto_refresh_token=False, persist_session=False)
+
+
+def get_shared_client(config):
+    """Returns the worker's shared Supabase client for table queries."""
+    key = (os.getpid(), config["SUPABASE_URL"], config["SUPABASE_KEY"])
+    client = _registry.get(key)
+    if client is not None:
+        return client
+
+    with _registry_lock:
+        client = _registry.get(key)
+        if client is None:
+            max_connections = config.get("SUPABASE_MAX_CONNECTIONS", 20)
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=config.get("SUPABASE_KEEPALIVE_EXPIRY", 60),
+            )
+            client = PooledClient(
+                config["SUPABASE_URL"],
+                config["SUPABASE_KEY"],
+                options=_session_free_options(),
+                limits=limits,
+            )
+            _registry[key] = client
+    return client
+
+
+def create_auth_client(config):
+    """Returns a fresh client for sign-in and password flows so user sessions stay isolated."""
+    return Client(
+        config["SUPABASE_URL"], config["SUPABASE_KEY"], options=_session_free_options()
+    )
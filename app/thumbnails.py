@@ -0,0 +1,144 @@
+# thumbnails.py
+import os
+import base64
+import hashlib
+import logging
+import threading
+
+import dropbox
+
+logger = logging.getLogger(__name__)
+
+# files/get_thumbnail_batch accepts at most 25 files per call
+BATCH_SIZE = 25
+
+
+class ThumbnailStore:
+    """Small renditions of Dropbox images, cached on disk under a byte budget.
+
+    Thumbnails are keyed by path and content hash, so a re-upload gets a new
+    entry and a cached file never needs invalidating. Missing thumbnails are
+    fetched BATCH_SIZE at a time. A file's modification time records when it was
+    last served; once the directory grows past max_bytes, the least recently
+    served files are deleted. The directory is shared by all workers, so the
+    eviction pass works from what is on disk rather than per-process state.
+    """
+
+    def __init__(self, directory, max_bytes, size="w256h256", image_format="jpeg"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.image_format = image_format
+        self.mimetype = f"image/{image_format}"
+        self._bytes = None  # Estimate of the directory size, read on first write
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "fetched": 0, "failed": 0, "evicted": 0}
+
+    def get(self, path, content_hash):
+        """Returns the cached thumbnail bytes for this revision of path, or None."""
+        if not content_hash:
+            return None
+        file_path = self._path(path, content_hash)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            os.utime(file_path)  # Mark as recently served
+        except FileNotFoundError:
+            # Never cached, or evicted by another worker
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return data
+
+    def fetch(self, dbx, files):
+        """Makes sure thumbnails for files are cached.
+
+        files maps each Dropbox path to its content hash, or None if unknown.
+        Returns a dict mapping each path that has a thumbnail to its content hash;
+        paths Dropbox cannot render (unsupported type, too large) are left out.
+        """
+        available = {}
+        missing = []
+        for path, content_hash in files.items():
+            if content_hash and os.path.exists(self._path(path, content_hash)):
+                available[path] = content_hash
+            else:
+                missing.append(path)
+
+        for start in range(0, len(missing), BATCH_SIZE):
+            batch = missing[start : start + BATCH_SIZE]
+            try:
+                result = dbx.files_get_thumbnail_batch(
+                    [
+                        dropbox.files.ThumbnailArg(
+                            path,
+                            format=getattr(dropbox.files.ThumbnailFormat, self.image_format),
+                            size=getattr(dropbox.files.ThumbnailSize, self.size),
+                            mode=dropbox.files.ThumbnailMode.bestfit,
+                        )
+                        for path in batch
+                    ]
+                )
+            except Exception as e:
+                logger.error(f"Failed to fetch {len(batch)} thumbnails: {e}")
+                self._stats["failed"] += len(batch)
+                continue
+            # Entries come back in request order
+            for path, entry in zip(batch, result.entries):
+                if not entry.is_success():
+                    logger.info(f"No thumbnail for {path}: {entry.get_failure()}")
+                    self._stats["failed"] += 1
+                    continue
+                data = entry.get_success()
+                content_hash = data.metadata.content_hash
+                self._put(path, content_hash, base64.b64decode(data.thumbnail))
+                available[path] = content_hash
+                self._stats["fetched"] += 1
+        return available
+
+    def stats(self):
+        return {**self._stats, "bytes": self._bytes}
+
+    def _path(self, path, content_hash):
+        key = hashlib.sha256(f"{path.lower()}\n{content_hash}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.{self.image_format}")
+
+    def _put(self, path, content_hash, data):
+        # Created on first use, so importing the app leaves the filesystem alone
+        os.makedirs(self.directory, exist_ok=True)
+        file_path = self._path(path, content_hash)
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, file_path)
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self._disk_usage()
+            else:
+                self._bytes += len(data)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _disk_usage(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _evict(self):
+        # Trim to 90% of the budget so every write past the limit isn't a full scan
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, file_path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(file_path)
+                self._stats["evicted"] += 1
+            except FileNotFoundError:
+                pass  # Already evicted by another worker
+            total -= size
+        self._bytes = total
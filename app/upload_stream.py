@@ -0,0 +1,455 @@
+# upload_stream.py
+import io
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import dropbox
+import requests
+from dropbox.exceptions import ApiError, HttpError
+from werkzeug.sansio.multipart import (
+    MultipartDecoder,
+    Field,
+    File,
+    Epilogue,
+    NeedData,
+)
+
+logger = logging.getLogger(__name__)
+
+CONCURRENT_CHUNK_UNIT = 4 * 1024 * 1024
+
+# Dropbox hashes file content in blocks of this size
+CONTENT_HASH_BLOCK = 4 * 1024 * 1024
+
+
+class ContentHasher:
+    """Computes Dropbox's content_hash incrementally.
+
+    The hash is the SHA-256 of the concatenated SHA-256 digests of each 4 MiB
+    block, so it matches FileMetadata.content_hash without a round trip.
+    """
+
+    def __init__(self):
+        self._overall = hashlib.sha256()
+        self._block = hashlib.sha256()
+        self._block_length = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), CONTENT_HASH_BLOCK - self._block_length)
+            self._block.update(view[:take])
+            self._block_length += take
+            view = view[take:]
+            if self._block_length == CONTENT_HASH_BLOCK:
+                self._overall.update(self._block.digest())
+                self._block = hashlib.sha256()
+                self._block_length = 0
+
+    def hexdigest(self):
+        overall = self._overall.copy()
+        if self._block_length:
+            overall.update(self._block.digest())
+        return overall.hexdigest()
+
+
+class StreamedPart:
+    """One part of a multipart body that is being read from the network.
+
+    File parts mimic FileStorage closely enough for the upload helpers: they have
+    a name, a filename and a stream. Field parts carry their decoded value.
+    """
+
+    def __init__(self, name, filename=None, stream=None, value=None):
+        self.name = name
+        self.filename = filename
+        self.stream = stream
+        self.value = value
+
+
+class _PartReader(io.RawIOBase):
+    def __init__(self, multipart):
+        super().__init__()
+        self._multipart = multipart
+        self._pending = b""
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            event = self._multipart.next_event()
+            self._pending = event.data
+            self._done = not event.more_data
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class MultipartStream:
+    """Decodes a multipart/form-data body incrementally, part by part.
+
+    Unlike request.files nothing is spooled: each file part must be read from its
+    stream before moving on, and whatever is left unread is skipped.
+    """
+
+    def __init__(self, stream, boundary, read_size=64 * 1024):
+        self._stream = stream
+        self._decoder = MultipartDecoder(boundary)
+        self._read_size = read_size
+
+    def next_event(self):
+        while True:
+            event = self._decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            # An empty read means the body is complete
+            self._decoder.receive_data(self._stream.read(self._read_size) or None)
+
+    def parts(self):
+        while True:
+            event = self.next_event()
+            if isinstance(event, Epilogue):
+                return
+            if isinstance(event, Field):
+                value = _PartReader(self).read().decode("utf-8", "replace")
+                yield StreamedPart(event.name, value=value)
+            elif isinstance(event, File):
+                reader = _PartReader(self)
+                yield StreamedPart(event.name, filename=event.filename, stream=reader)
+                while reader.read(self._read_size):
+                    pass  # Skip whatever the caller left unread
+
+
+def call_with_retries(action, description, max_retries, retry_delay, on_retry=None):
+    for attempt in range(max_retries):
+        try:
+            return action()
+        except (ApiError, HttpError, requests.exceptions.ConnectionError) as err:
+            logger.error(f"Attempt {attempt + 1} failed during {description}: {err}")
+            if attempt < max_retries - 1:
+                if on_retry is not None:
+                    on_retry()
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                logger.error(f"Failed {description} after {max_retries} attempts.")
+                raise
+
+
+class UploadSessionWriter:
+    """Feeds bytes into a Dropbox upload session as they arrive.
+
+    Data goes out in chunk_size pieces and only the piece being sent is held in
+    memory; per-chunk retries resend it from there. If a piece still fails after
+    its retries, it and everything after it are spilled to a temporary file and
+    sent again from disk when the upload is closed or finished. A held writer
+    spills from the start, so nothing is sent until then and an upload that
+    turns out to be a duplicate can be discarded without any transfer.
+    """
+
+    def __init__(self, dbx, chunk_size, spill_dir, max_retries=5, retry_delay=2, hold=False):
+        self.dbx = dbx
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.session_id = None
+        self.offset = 0  # Bytes acknowledged by Dropbox
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.retries = 0
+        self._progress_lock = threading.Lock()
+        self.closed = False
+        self._buffer = bytearray()
+        self._spill = tempfile.TemporaryFile(dir=spill_dir) if hold else None
+        self._hasher = ContentHasher()
+
+    @property
+    def content_hash(self):
+        """Dropbox content hash of everything written so far."""
+        return self._hasher.hexdigest()
+
+    def write(self, data):
+        self.bytes_received += len(data)
+        self._hasher.update(data)
+        if self._spill is not None:
+            self._spill.write(data)
+            return
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size and self._spill is None:
+            chunk = bytes(self._buffer[: self.chunk_size])
+            del self._buffer[: self.chunk_size]
+            self._send_or_spill(chunk)
+
+    def close(self):
+        """Sends everything left and closes the session so it can be committed later."""
+        self._replay_spill()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._send(data, close=True)
+
+    def discard(self):
+        """Drops whatever has not been sent; an open session simply expires unused."""
+        self._buffer = bytearray()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def finish(self, dropbox_path):
+        """Sends everything left and commits the upload, returning its FileMetadata."""
+        self._replay_spill()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        if self.session_id is None:
+            # The whole file fitted in one chunk, so a plain upload is enough
+            metadata = self._call(
+                lambda: self.dbx.files_upload(data, dropbox_path, mute=True),
+                f"upload of {dropbox_path}",
+            )
+            self._count_sent(len(data))
+            return metadata
+        cursor = dropbox.files.UploadSessionCursor(
+            session_id=self.session_id, offset=self.offset
+        )
+        commit = dropbox.files.CommitInfo(path=dropbox_path, mute=True)
+        metadata = self._call(
+            lambda: self.dbx.files_upload_session_finish(data, cursor, commit),
+            f"session finish for {dropbox_path}",
+        )
+        self.offset += len(data)
+        self._count_sent(len(data))
+        return metadata
+
+    def _call(self, action, description):
+        return call_with_retries(
+            action, description, self.max_retries, self.retry_delay, on_retry=self._count_retry
+        )
+
+    def _count_retry(self):
+        with self._progress_lock:
+            self.retries += 1
+
+    def _count_sent(self, length):
+        with self._progress_lock:
+            self.bytes_sent += length
+
+    def _send_or_spill(self, chunk):
+        try:
+            self._send(chunk)
+        except Exception as e:
+            logger.warning(f"Spilling upload to disk at offset {self.offset}: {e}")
+            self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+            self._spill.write(chunk)
+            self._spill.write(self._buffer)
+            self._buffer.clear()
+
+    def _send(self, chunk, close=False):
+        if self.session_id is None:
+            result = self._call(
+                lambda: self.dbx.files_upload_session_start(chunk, close=close),
+                "session start",
+            )
+            self.session_id = result.session_id
+        else:
+            self._call(
+                lambda: self._append(chunk, close),
+                "session append",
+            )
+        self.offset += len(chunk)
+        self._count_sent(len(chunk))
+        self.closed = close
+
+    def _append(self, chunk, close):
+        cursor = dropbox.files.UploadSessionCursor(
+            session_id=self.session_id, offset=self.offset
+        )
+        try:
+            self.dbx.files_upload_session_append_v2(chunk, cursor, close=close)
+        except ApiError as err:
+            # A retried append whose first attempt did arrive reports the offset
+            # it already reached; that counts as success.
+            error = err.error
+            if (
+                isinstance(error, dropbox.files.UploadSessionLookupError)
+                and error.is_incorrect_offset()
+                and error.get_incorrect_offset().correct_offset == self.offset + len(chunk)
+            ):
+                return
+            raise
+
+    def _replay_spill(self):
+        if self._spill is None:
+            return
+        spill, self._spill = self._spill, None
+        spill.seek(0)
+        try:
+            while True:
+                chunk = spill.read(self.chunk_size)
+                if not chunk:
+                    break
+                self._send(chunk)
+        finally:
+            spill.close()
+
+
+class ConcurrentUploadSessionWriter(UploadSessionWriter):
+    """Feeds bytes into a Dropbox concurrent upload session, several chunks at a time.
+
+    Up to parallelism chunks are in flight at once, each with its own retries;
+    write() blocks while all slots are busy, so memory stays bounded by roughly
+    parallelism x chunk_size. A chunk that still fails is spilled to a temporary
+    file and resent once the others are done. The session is closed with the final
+    piece and committed once at the end.
+    """
+
+    def __init__(
+        self, dbx, chunk_size, spill_dir, parallelism, max_retries=5, retry_delay=2
+    ):
+        # Concurrent sessions only accept pieces in multiples of 4 MiB
+        chunk_size = max(
+            CONCURRENT_CHUNK_UNIT, chunk_size // CONCURRENT_CHUNK_UNIT * CONCURRENT_CHUNK_UNIT
+        )
+        super().__init__(dbx, chunk_size, spill_dir, max_retries, retry_delay)
+        self.parallelism = parallelism
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(parallelism)
+        self._futures = []
+        self._next_offset = 0
+        self._failed_chunks = []  # (offset, position in spill file, length)
+        self._spill_lock = threading.Lock()
+
+    def write(self, data):
+        self.bytes_received += len(data)
+        self._hasher.update(data)
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[: self.chunk_size])
+            del self._buffer[: self.chunk_size]
+            self._submit(chunk)
+
+    def close(self):
+        """Waits for all chunks, sends the final piece and closes the session."""
+        if self.session_id is None:
+            self._start_session()
+        self._wait_for_chunks()
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        offset = self._next_offset
+        self._call(
+            lambda: self._append_at(offset, data, close=True),
+            "final session append",
+        )
+        self.offset = offset + len(data)
+        self._count_sent(len(data))
+        self.closed = True
+
+    def discard(self):
+        """Drops unsent data and stops queued chunks; those in flight finish unused."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._futures = []
+        with self._spill_lock:
+            self._failed_chunks = []
+            super().discard()
+
+    def finish(self, dropbox_path):
+        """Closes the session if needed and commits it, returning its FileMetadata."""
+        if self.session_id is None and not self.closed:
+            # The whole file fitted in one chunk, so a plain upload is enough
+            return super().finish(dropbox_path)
+        if not self.closed:
+            self.close()
+        cursor = dropbox.files.UploadSessionCursor(
+            session_id=self.session_id, offset=self.offset
+        )
+        commit = dropbox.files.CommitInfo(path=dropbox_path, mute=True)
+        return self._call(
+            lambda: self.dbx.files_upload_session_finish(b"", cursor, commit),
+            f"session finish for {dropbox_path}",
+        )
+
+    def _start_session(self):
+        result = self._call(
+            lambda: self.dbx.files_upload_session_start(
+                b"", session_type=dropbox.files.UploadSessionType.concurrent
+            ),
+            "concurrent session start",
+        )
+        self.session_id = result.session_id
+
+    def _submit(self, chunk):
+        if self.session_id is None:
+            self._start_session()
+            self._executor = ThreadPoolExecutor(max_workers=self.parallelism)
+        offset = self._next_offset
+        self._next_offset += len(chunk)
+        self._slots.acquire()
+        future = self._executor.submit(self._send_chunk, offset, chunk)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _send_chunk(self, offset, chunk):
+        try:
+            self._call(
+                lambda: self._append_at(offset, chunk),
+                f"session append at offset {offset}",
+            )
+            self._count_sent(len(chunk))
+        except Exception as e:
+            logger.warning(f"Spilling chunk at offset {offset} to disk: {e}")
+            with self._spill_lock:
+                if self._spill is None:
+                    self._spill = tempfile.TemporaryFile(dir=self.spill_dir)
+                self._spill.seek(0, io.SEEK_END)
+                self._failed_chunks.append((offset, self._spill.tell(), len(chunk)))
+                self._spill.write(chunk)
+
+    def _wait_for_chunks(self):
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._spill is None:
+            return
+
+        spill, self._spill = self._spill, None
+        try:
+            for offset, position, length in self._failed_chunks:
+                spill.seek(position)
+                chunk = spill.read(length)
+                self._call(
+                    lambda: self._append_at(offset, chunk),
+                    f"session append at offset {offset}",
+                )
+                self._count_sent(length)
+            self._failed_chunks = []
+        finally:
+            spill.close()
+
+    def _append_at(self, offset, chunk, close=False):
+        cursor = dropbox.files.UploadSessionCursor(session_id=self.session_id, offset=offset)
+        self.dbx.files_upload_session_append_v2(chunk, cursor, close=close)
+
+
+def open_upload_writer(dbx, chunk_size, spill_dir, parallelism=1, hold=False):
+    """Returns a concurrent session writer when parallelism allows, else a sequential one.
+
+    With hold, the data is kept on disk until the upload is finished; held
+    uploads are sent sequentially.
+    """
+    if hold:
+        return UploadSessionWriter(dbx, chunk_size, spill_dir, hold=True)
+    if parallelism > 1:
+        return ConcurrentUploadSessionWriter(dbx, chunk_size, spill_dir, parallelism)
+    return UploadSessionWriter(dbx, chunk_size, spill_dir)
+
@@ -0,0 +1,134 @@
+# version_index.py
+import re
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .folder_cache import normalize_path
+
+# Upload stamps: name_YYYYmmdd_HHMMSS.ext for files, name_YYYYmmddHHMMSS for folders
+_STAMP_PATTERN = re.compile(r"_(\d{8})_?(\d{6})(?:\.[^.]*)?$")
+
+
+def parse_version_time(filename):
+    """Returns the upload time stamped into filename, or None."""
+    match = _STAMP_PATTERN.search(filename)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+    except ValueError:
+        return None
+
+
+def _version(entry):
+    uploaded_at = parse_version_time(entry["name"]) or entry.get("server_modified")
+    return {
+        "filename": entry["name"],
+        "filepath": entry["name"],
+        "path_display": entry["path_display"],
+        "uploaded_at": uploaded_at,
+        "size": entry.get("size"),
+        "content_hash": entry.get("content_hash"),
+    }
+
+
+def _sort_key(version):
+    # Unstamped files without a modification time sort as oldest
+    return (version["uploaded_at"] or datetime.min, version["filename"])
+
+
+class _Versions:
+    def __init__(self, versions, stamp):
+        self.versions = sorted(versions, key=_sort_key)  # Oldest first
+        self.keys = [_sort_key(v) for v in self.versions]
+        self.stamp = stamp  # Of the folder listing the versions were read from
+
+
+class VersionIndex:
+    """Versions of each asset folder, ordered by upload time.
+
+    Upload time comes from the timestamp stamped into the filename, falling back
+    to Dropbox's server_modified. A folder is indexed from its cached listing on
+    first use and rebuilt whenever the folder cache reports that listing changed,
+    so uploads by other workers or in Dropbox itself show up as soon as the
+    listing does; this worker's uploads are inserted directly. Latest is a lookup
+    of the last element, "since" a bisect, and history pages are slices.
+    """
+
+    def __init__(self, folder_cache, max_folders):
+        self.folder_cache = folder_cache
+        self.max_folders = max_folders
+        self._folders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def latest(self, dbx, folder):
+        versions = self._get(dbx, folder).versions
+        return versions[-1] if versions else None
+
+    def history(self, dbx, folder, offset=0, limit=20):
+        """Returns (versions newest first, whether older ones follow)."""
+        versions = self._get(dbx, folder).versions
+        end = max(0, len(versions) - offset)
+        start = max(0, end - limit)
+        return versions[start:end][::-1], start > 0
+
+    def since(self, dbx, folder, timestamp):
+        """Versions uploaded after timestamp, newest first."""
+        indexed = self._get(dbx, folder)
+        start = bisect.bisect_right(indexed.keys, (timestamp, "\uffff"))
+        return indexed.versions[start:][::-1]
+
+    def with_content_hash(self, dbx, folder, content_hash):
+        """Versions whose content matches content_hash, newest first."""
+        versions = self._get(dbx, folder).versions
+        return [v for v in reversed(versions) if v["content_hash"] == content_hash]
+
+    def record_upload(self, dropbox_path, metadata=None):
+        """Inserts a completed upload into its folder's versions if that folder is indexed."""
+        folder, name = dropbox_path.rsplit("/", 1)
+        key = normalize_path(folder)
+        entry = {
+            "name": name,
+            "path_display": dropbox_path,
+            "server_modified": getattr(metadata, "server_modified", None),
+            "size": getattr(metadata, "size", None),
+            "content_hash": getattr(metadata, "content_hash", None),
+        }
+        with self._lock:
+            indexed = self._folders.get(key)
+            if indexed is None:
+                return
+            version = _version(entry)
+            indexed.versions = [v for v in indexed.versions if v["filename"] != version["filename"]]
+            indexed.keys = [_sort_key(v) for v in indexed.versions]
+            position = bisect.bisect_right(indexed.keys, _sort_key(version))
+            indexed.versions.insert(position, version)
+            indexed.keys.insert(position, _sort_key(version))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "folders": len(self._folders),
+                "versions": sum(len(indexed.versions) for indexed in self._folders.values()),
+            }
+
+    def _get(self, dbx, folder):
+        key = normalize_path(folder)
+        # The folder cache keeps the listing current from its Dropbox cursor
+        entries, stamp = self.folder_cache.list_with_stamp(dbx, key)
+        with self._lock:
+            indexed = self._folders.get(key)
+            if indexed is not None:
+                self._folders.move_to_end(key)
+        if indexed is not None and indexed.stamp == stamp:
+            return indexed
+
+        indexed = _Versions((_version(e) for e in entries if e["type"] == "file"), stamp)
+        with self._lock:
+            self._folders[key] = indexed
+            self._folders.move_to_end(key)
+            while len(self._folders) > self.max_folders:
+                self._folders.popitem(last=False)
+        return indexed
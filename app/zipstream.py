@@ -0,0 +1,127 @@
+# zipstream.py
+import io
+import queue
+import threading
+import zipfile
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import dropbox
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable target that hands ZipFile output back in chunks."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def list_files_recursive(dbx, path):
+    """Returns FileMetadata for every file below path."""
+    result = dbx.files_list_folder(path, recursive=True)
+    files = []
+    while True:
+        files.extend(
+            entry for entry in result.entries if isinstance(entry, dropbox.files.FileMetadata)
+        )
+        if not result.has_more:
+            return files
+        result = dbx.files_list_folder_continue(result.cursor)
+
+
+def _put(chunks, item, cancelled):
+    while not cancelled.is_set():
+        try:
+            chunks.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch(dbx, entry, chunks, chunk_size, cancelled):
+    try:
+        _, res = dbx.files_download(entry.path_lower)
+        try:
+            for chunk in res.iter_content(chunk_size=chunk_size):
+                if not _put(chunks, chunk, cancelled):
+                    return
+        finally:
+            res.close()
+        _put(chunks, _DONE, cancelled)
+    except Exception as e:
+        _put(chunks, e, cancelled)
+
+
+def stream_folder_zip(dbx, files, folder_path, folder_name, parallelism, memory_budget, chunk_size):
+    """Builds a ZIP64 archive of files on the fly, yielding it chunk by chunk.
+
+    Up to parallelism files download at once. Each download buffers into its own
+    bounded queue, so file data held in memory stays within memory_budget however
+    large the folder is. Entries are stored uncompressed, since art assets are
+    mostly compressed formats already.
+    """
+    prefix_length = len(folder_path.rstrip("/"))
+    queue_size = max(1, memory_budget // (parallelism * chunk_size) - 1)
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=parallelism)
+    remaining = iter(files)
+    in_flight = deque()
+
+    def schedule_next():
+        entry = next(remaining, None)
+        if entry is not None:
+            chunks = queue.Queue(maxsize=queue_size)
+            executor.submit(_fetch, dbx, entry, chunks, chunk_size, cancelled)
+            in_flight.append((entry, chunks))
+
+    sink = _ChunkSink()
+    archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True)
+    try:
+        for _ in range(parallelism):
+            schedule_next()
+
+        while in_flight:
+            entry, chunks = in_flight.popleft()
+            zinfo = zipfile.ZipInfo(
+                f"{folder_name}{entry.path_display[prefix_length:]}",
+                date_time=entry.client_modified.timetuple()[:6],
+            )
+            zinfo.file_size = entry.size
+            with archive.open(zinfo, mode="w") as dest:
+                while True:
+                    item = chunks.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    dest.write(item)
+                    yield from sink.drain()
+            schedule_next()
+            yield from sink.drain()
+
+        archive.close()
+        yield from sink.drain()
+    except Exception as e:
+        logger.error(f"Failed while streaming zip of {folder_path}: {e}")
+        raise
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
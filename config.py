@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     # Ensures that a SECRET_KEY is set in the environment, otherwise throws an error.
@@ -9,8 +10,87 @@ class Config:
     DROPBOX_OAUTH2_REFRESH_TOKEN = os.environ.get('DROPBOX_REFRESH_TOKEN')
     DROPBOX_APP_KEY = os.environ.get('DROPBOX_APP_KEY')
     DROPBOX_APP_SECRET = os.environ.get('DROPBOX_APP_SECRET')
+    # Connection pool size and how long before expiry the shared token is refreshed
+    DROPBOX_MAX_CONNECTIONS = int(os.environ.get('DROPBOX_MAX_CONNECTIONS', 16))
+    DROPBOX_TOKEN_REFRESH_MARGIN = int(os.environ.get('DROPBOX_TOKEN_REFRESH_MARGIN', 600))
+    # Concurrent temporary-link lookups for download page thumbnails
+    THUMBNAIL_LINK_WORKERS = int(os.environ.get('THUMBNAIL_LINK_WORKERS', 8))
+    THUMBNAIL_LINK_TIMEOUT = float(os.environ.get('THUMBNAIL_LINK_TIMEOUT', 5))
+    # Thumbnails rendered by Dropbox are cached on disk, in a directory shared by the
+    # workers, up to this many bytes and served with a long max-age, since each URL
+    # names one revision of the file
+    THUMBNAIL_CACHE_DIR = os.environ.get(
+        'THUMBNAIL_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'asset-manager-thumbnails')
+    )
+    THUMBNAIL_CACHE_BYTES = int(os.environ.get('THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024))
+    THUMBNAIL_SIZE = os.environ.get('THUMBNAIL_SIZE', 'w256h256')
+    THUMBNAIL_FORMAT = os.environ.get('THUMBNAIL_FORMAT', 'jpeg')
+    THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', 365 * 24 * 60 * 60))
+    # Temporary links are valid for 4 hours; cache them for 3 to stay safely inside that
+    TEMPORARY_LINK_CACHE_SIZE = int(os.environ.get('TEMPORARY_LINK_CACHE_SIZE', 5000))
+    TEMPORARY_LINK_CACHE_TTL = int(os.environ.get('TEMPORARY_LINK_CACHE_TTL', 3 * 60 * 60))
+    # Folder listings are refreshed from their Dropbox cursor once older than the interval,
+    # or kept current by a background longpoll watcher when enabled
+    FOLDER_CACHE_SIZE = int(os.environ.get('FOLDER_CACHE_SIZE', 2000))
+    FOLDER_CACHE_REFRESH_INTERVAL = float(os.environ.get('FOLDER_CACHE_REFRESH_INTERVAL', 30))
+    FOLDER_CACHE_LONGPOLL = os.environ.get('FOLDER_CACHE_LONGPOLL', 'false').lower() == 'true'
+    # Explorer subtrees come from one recursive listing, cut off at this depth or entry count
+    FOLDER_TREE_MAX_DEPTH = int(os.environ.get('FOLDER_TREE_MAX_DEPTH', 6))
+    FOLDER_TREE_MAX_ENTRIES = int(os.environ.get('FOLDER_TREE_MAX_ENTRIES', 20000))
+    # The asset search index applies Dropbox changes at most this often, and waits
+    # SEARCH_INDEX_RETRY_INTERVAL after a failed crawl or refresh
+    SEARCH_INDEX_REFRESH_INTERVAL = float(os.environ.get('SEARCH_INDEX_REFRESH_INTERVAL', 60))
+    SEARCH_INDEX_RETRY_INTERVAL = float(os.environ.get('SEARCH_INDEX_RETRY_INTERVAL', 60))
+    # Asset version histories are indexed per folder and rebuilt whenever the folder
+    # cache's listing changes; the download page shows them a page at a time
+    VERSION_INDEX_SIZE = int(os.environ.get('VERSION_INDEX_SIZE', 500))
+    VERSION_PAGE_SIZE = int(os.environ.get('VERSION_PAGE_SIZE', 20))
+    # Live dashboard streams: open streams per worker (each holds one of the worker's
+    # GUNICORN_THREADS, so keep it well below that), keepalive interval in seconds, and
+    # whether changes made by other workers are relayed from Supabase realtime
+    EVENT_STREAM_MAX_CLIENTS = int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 16))
+    EVENT_STREAM_HEARTBEAT = float(os.environ.get('EVENT_STREAM_HEARTBEAT', 15))
+    EVENT_STREAM_REALTIME = os.environ.get('EVENT_STREAM_REALTIME', 'false').lower() == 'true'
+    # Names the deployed code in page ETags (e.g. its git sha); without it, a digest of
+    # the app's Python modules and templates is used
+    APP_VERSION = os.environ.get('APP_VERSION') or os.environ.get('HEROKU_SLUG_COMMIT')
+    # Size of each chunk relayed from Dropbox to the client during downloads
+    DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+    # Folders over the Dropbox zip limit are zipped locally from parallel downloads,
+    # holding at most ZIP_STREAM_MEMORY_BUDGET bytes of file data at once
+    ZIP_STREAM_PARALLELISM = int(os.environ.get('ZIP_STREAM_PARALLELISM', 4))
+    ZIP_STREAM_MEMORY_BUDGET = int(os.environ.get('ZIP_STREAM_MEMORY_BUDGET', 64 * 1024 * 1024))
+    # Uploads are relayed to Dropbox upload sessions in chunks of this size as they arrive.
+    # With UPLOAD_PARALLELISM above 1, that many chunks are sent at once on a concurrent
+    # session; the chunk size is then rounded down to a multiple of 4 MiB.
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_PARALLELISM = int(os.environ.get('UPLOAD_PARALLELISM', 4))
+    # Files of a folder upload sent at once before being committed in one batch
+    FOLDER_UPLOAD_WORKERS = int(os.environ.get('FOLDER_UPLOAD_WORKERS', 8))
+    # What to do with an upload whose content matches an existing version: 'copy' it
+    # server-side under the new name, 'skip' it with only an activity entry, or 'off'
+    DEDUP_MODE = os.environ.get('DEDUP_MODE', 'copy').lower()
+    # Background transfer jobs that commit uploads after the request has returned
+    TRANSFER_JOB_WORKERS = int(os.environ.get('TRANSFER_JOB_WORKERS', 4))
+    TRANSFER_JOB_PROGRESS_INTERVAL = float(os.environ.get('TRANSFER_JOB_PROGRESS_INTERVAL', 2))
+    # Rows per page of the dashboard and assignments tables
+    DASHBOARD_PAGE_SIZE = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+    # Comments per activity entry; this worker's own writes update it directly, so the
+    # TTL only bounds how long comments posted through other workers take to show up
+    COMMENT_CACHE_SIZE = int(os.environ.get('COMMENT_CACHE_SIZE', 5000))
+    COMMENT_CACHE_TTL = int(os.environ.get('COMMENT_CACHE_TTL', 60))
+    # Activity log rows are queued and written in multi-row inserts by a background thread
+    ACTIVITY_QUEUE_SIZE = int(os.environ.get('ACTIVITY_QUEUE_SIZE', 10000))
+    ACTIVITY_BATCH_SIZE = int(os.environ.get('ACTIVITY_BATCH_SIZE', 100))
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 1))
+    # Connection pool and default per-call timeout of the asyncio service layer
+    ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 32))
+    ASYNC_CALL_TIMEOUT = float(os.environ.get('ASYNC_CALL_TIMEOUT', 10))
     SUPABASE_URL = os.environ.get('SUPABASE_URL')
     SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+    # Keep-alive pool for the shared PostgREST transport
+    SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', 20))
+    SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', 60))
 
 # Export configuration class
 config = Config()
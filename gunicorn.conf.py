@@ -0,0 +1,36 @@
+# gunicorn.conf.py
+# Picked up automatically by the gunicorn command in the Procfile.
+import os
+import time
+
+# Import the app and the Dropbox and Supabase SDKs once in the master; forked
+# workers then share those pages instead of each importing them again. Every
+# client, pool and background thread in the app is created per process on
+# first use, so nothing started in the master leaks into the workers.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Live dashboard event streams stay open as long as the page does, which would
+# take a whole sync worker each; threaded workers serve them one thread apiece.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
+
+_boot_started = time.perf_counter()
+
+
+def when_ready(server):
+    server.log.info(
+        f"Master ready in {time.perf_counter() - _boot_started:.2f}s "
+        f"(preload_app={preload_app})"
+    )
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_worker_init(worker):
+    # time.perf_counter is monotonic across fork, so this includes the app
+    # import when preloading is off
+    worker.log.info(
+        f"Worker {worker.pid} ready {time.perf_counter() - worker.fork_started:.2f}s after fork"
+    )